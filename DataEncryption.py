@@ -1,19 +1,94 @@
 """
 Flask API for encrypting and decrypting data. Supports JSON, text, and files.
-Uses cryptography.ferne for data handling.
+Uses cryptography.fernet for data handling.
 Endpoints: `/encrypt` and `/decrypt`
-Encrypted data is base64-encode
+Encrypted data is base64-encoded in JSON mode.
+Bodies sent as `application/octet-stream` are streamed instead: the plaintext is cut into
+chunks, each sealed with AES-GCM under a per-stream key derived from the Fernet key, so memory
+stays bounded whatever the payload size. The key travels in the `X-Encryption-Key` header.
+Run `python DataEncryption.py benchmark [size_mb]` to compare both paths.
+Ciphers are cached per key. With `ACTIVE_ENCRYPTION_KEY` (and optionally
+`RETIRED_ENCRYPTION_KEYS`) set, JSON requests without a key use that key ring, and
+`python DataEncryption.py reencrypt <input> <output> [workers]` rotates stored tokens to the active key.
 """
 
-from flask import Flask, request, jsonify
-from cryptography.fernet import Fernet, InvalidToken
+from flask import Flask, Response, request, jsonify, stream_with_context
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import base64
+import hashlib
+import itertools
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from instrumentation import instrument_app
 
 app = Flask(__name__)
+metrics = instrument_app(app, "crypto")
+
+STREAM_CONTENT_TYPE = "application/octet-stream"
+STREAM_KEY_HEADER = "X-Encryption-Key"
+STREAM_CHUNK_BYTES = int(os.environ.get("ENCRYPT_CHUNK_BYTES", str(64 * 1024)))
+STREAM_MAX_CHUNK_BYTES = 16 * 1024 * 1024
+STREAM_MAGIC = b"SGE1"
+STREAM_SALT_BYTES = 16
+STREAM_TAG_BYTES = 16
+_FINAL_FRAME = 0x80000000
+
+CIPHER_CACHE_SIZE = int(os.environ.get("CIPHER_CACHE_SIZE", "1024"))
+ACTIVE_ENCRYPTION_KEY = os.environ.get("ACTIVE_ENCRYPTION_KEY")
+RETIRED_ENCRYPTION_KEYS = [key.strip() for key in os.environ.get("RETIRED_ENCRYPTION_KEYS", "").split(",") if key.strip()]
+REENCRYPT_BATCH_SIZE = int(os.environ.get("REENCRYPT_BATCH_SIZE", "2000"))
+
+def key_fingerprint(key):
+    """Short public identifier for a key (the `key_id` in responses); not used for cache lookups."""
+    return hashlib.sha256(key.encode() if isinstance(key, str) else key).hexdigest()[:16]
+
+class CipherCache:
+    """
+    LRU of key bytes -> Fernet, so a key is parsed once rather than on every request.
+    Entries are keyed by the key itself, not a fingerprint, so two keys can never share a cipher.
+    """
+
+    def __init__(self, max_size=CIPHER_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the Fernet for `key`; raises ValueError when it is not a valid Fernet key."""
+        key = key.encode() if isinstance(key, str) else bytes(key)
+        with self.lock:
+            cipher = self.entries.get(key)
+            if cipher is not None:
+                self.entries.move_to_end(key)
+                return cipher
+        cipher = Fernet(key)
+        with self.lock:
+            self.entries[key] = cipher
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return cipher
+
+cipher_cache = CipherCache()
+
+def build_keyring(active_key, retired_keys=()):
+    """MultiFernet that encrypts with `active_key` and decrypts with it or any retired key."""
+    return MultiFernet([cipher_cache.get(key) for key in [active_key, *retired_keys]])
+
+keyring = build_keyring(ACTIVE_ENCRYPTION_KEY, RETIRED_ENCRYPTION_KEYS) if ACTIVE_ENCRYPTION_KEY else None
 
 def is_valid_fernet_key(key):
     try:
-        Fernet(key.encode())
+        cipher_cache.get(key)
         return True
     except (ValueError, InvalidToken):
         return False
@@ -25,27 +100,156 @@ def is_valid_base64(data):
     except (ValueError, TypeError):
         return False
 
+def derive_stream_key(key, salt):
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"SafeGamingApi stream v1").derive(base64.urlsafe_b64decode(key))
+
+def _frame_nonce(counter):
+    return struct.pack(">IQ", 0, counter)
+
+def encrypt_stream(read, key, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Yields the framed ciphertext of everything `read(n)` returns:
+    MAGIC | salt | chunk size, then per chunk a 4-byte length (high bit marks the last frame)
+    and the AES-GCM ciphertext. The nonce is the frame counter and the header and final flag are
+    authenticated, so reordered, dropped or truncated frames fail to decrypt.
+    """
+    salt = os.urandom(STREAM_SALT_BYTES)
+    header = STREAM_MAGIC + salt + struct.pack(">I", chunk_size)
+    cipher = AESGCM(derive_stream_key(key, salt))
+    yield header
+    chunk = read(chunk_size)
+    for counter in itertools.count():
+        next_chunk = read(chunk_size) if chunk else b""
+        final = not next_chunk
+        sealed = cipher.encrypt(_frame_nonce(counter), chunk, header + (b"\1" if final else b"\0"))
+        yield struct.pack(">I", len(sealed) | (_FINAL_FRAME if final else 0)) + sealed
+        if final:
+            return
+        chunk = next_chunk
+
+def _read_exact(read, size):
+    parts, remaining = [], size
+    while remaining:
+        part = read(remaining)
+        if not part:
+            raise ValueError("Encrypted stream is truncated")
+        parts.append(part)
+        remaining -= len(part)
+    return b"".join(parts)
+
+def decrypt_stream(read, key):
+    """Inverse of `encrypt_stream`; raises InvalidToken on tampering and ValueError on bad framing."""
+    header = _read_exact(read, len(STREAM_MAGIC) + STREAM_SALT_BYTES + 4)
+    if not header.startswith(STREAM_MAGIC):
+        raise ValueError("Not an encrypted stream")
+    chunk_size, = struct.unpack(">I", header[-4:])
+    if not 0 < chunk_size <= STREAM_MAX_CHUNK_BYTES:
+        raise ValueError("Invalid chunk size in stream header")
+    cipher = AESGCM(derive_stream_key(key, header[len(STREAM_MAGIC):-4]))
+    for counter in itertools.count():
+        length, = struct.unpack(">I", _read_exact(read, 4))
+        final = bool(length & _FINAL_FRAME)
+        length &= ~_FINAL_FRAME
+        if length > chunk_size + STREAM_TAG_BYTES:
+            raise ValueError("Frame exceeds the declared chunk size")
+        try:
+            yield cipher.decrypt(_frame_nonce(counter), _read_exact(read, length),
+                                 header + (b"\1" if final else b"\0"))
+        except InvalidTag:
+            raise InvalidToken from None
+        if final:
+            if read(1):
+                raise ValueError("Data after the final frame")
+            return
+
+def _stream_key():
+    key = request.headers.get(STREAM_KEY_HEADER)
+    if key is not None and not is_valid_fernet_key(key):
+        return None, (jsonify({"error": "Invalid Fernet key provided"}), 400)
+    return key, None
+
+@app.route('/encrypt', methods=['POST'])
+def encrypt_data():
+    if request.mimetype == STREAM_CONTENT_TYPE:
+        key, error = _stream_key()
+        if error:
+            return error
+        generated = key is None
+        key = key or Fernet.generate_key().decode()
+        response = Response(stream_with_context(encrypt_stream(request.stream.read, key)),
+                            mimetype=STREAM_CONTENT_TYPE)
+        if generated:
+            response.headers[STREAM_KEY_HEADER] = key
+        return response
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "data" not in data:
+        return jsonify({"error": "JSON body with 'data' is required"}), 400
+
+    plaintext = data["data"] if isinstance(data["data"], str) else json.dumps(data["data"])
+    user_key = data.get("key")
+    if not user_key and keyring is not None:
+        with metrics.stage("encrypt"):
+            token = keyring.encrypt(plaintext.encode())
+        return jsonify({
+            "encrypted_data": base64.b64encode(token).decode(),
+            "key_id": key_fingerprint(ACTIVE_ENCRYPTION_KEY)
+        })
+
+    user_key = user_key or Fernet.generate_key().decode()
+    if not is_valid_fernet_key(user_key):
+        return jsonify({"error": "Invalid Fernet key provided"}), 400
+
+    with metrics.stage("encrypt"):
+        token = cipher_cache.get(user_key).encrypt(plaintext.encode())
+    return jsonify({
+        "encrypted_data": base64.b64encode(token).decode(),
+        "key": user_key
+    })
+
 @app.route('/decrypt', methods=['POST'])
 def decrypt_data():
+    if request.mimetype == STREAM_CONTENT_TYPE:
+        key, error = _stream_key()
+        if error:
+            return error
+        if key is None:
+            return jsonify({"error": f"The '{STREAM_KEY_HEADER}' header is required"}), 400
+        chunks = decrypt_stream(request.stream.read, key)
+        try:
+            first = next(chunks)
+        except InvalidToken:
+            return jsonify({"error": "Decryption failed: invalid key or tampered data"}), 400
+        except ValueError as e:
+            return jsonify({"error": f"Decryption failed: {str(e)}"}), 400
+        # Later frames are authenticated one by one; a failure there aborts the response mid-stream.
+        return Response(stream_with_context(itertools.chain([first], chunks)), mimetype=STREAM_CONTENT_TYPE)
+
     data = request.get_json()
     if not data:
         return jsonify({"error": "No JSON data provided"}), 400
 
     encrypted_data = data.get("encrypted_data")
     user_key = data.get("key")
-    if not encrypted_data or not user_key:
+    if not encrypted_data or not (user_key or keyring is not None):
         return jsonify({"error": "Both 'encrypted_data' and 'key' are required"}), 400
 
-    if not is_valid_fernet_key(user_key):
-        return jsonify({"error": "Invalid Fernet key provided"}), 400
+    if user_key:
+        try:
+            cipher = cipher_cache.get(user_key)
+        except (ValueError, InvalidToken):
+            return jsonify({"error": "Invalid Fernet key provided"}), 400
+    else:
+        cipher = keyring
 
     if not is_valid_base64(encrypted_data):
         return jsonify({"error": "Invalid base64-encoded data provided"}), 400
 
     try:
-        cipher = Fernet(user_key.encode())
         encrypted_data = base64.b64decode(encrypted_data.encode())
-        decrypted_data = decrypt_unknown_input(encrypted_data, cipher)
+        with metrics.stage("decrypt"):
+            decrypted_data = decrypt_unknown_input(encrypted_data, cipher)
     except Exception as e:
         return jsonify({"error": f"Decryption failed: {str(e)}"}), 400
 
@@ -63,5 +267,180 @@ def decrypt_unknown_input(encrypted_data, cipher):
         except UnicodeDecodeError:
             return decrypted_data
 
+_worker_keyring = None
+
+def _init_reencrypt_worker(active_key, retired_keys):
+    global _worker_keyring
+    _worker_keyring = build_keyring(active_key, retired_keys)
+
+def _reencrypt_batch(lines):
+    """
+    Rotates a batch of stored tokens (raw Fernet tokens or the base64 form the API returns) to the
+    active key, keeping each token's format and timestamp. Tokens no key can open are kept as-is,
+    and blank lines stay blank so output lines keep lining up with input lines.
+    """
+    rotated, failed = [], 0
+    for line in lines:
+        token = line.strip()
+        if not token:
+            rotated.append("")
+            continue
+        wrapped = not token.startswith("gAAAAA")
+        try:
+            raw = base64.b64decode(token, validate=True) if wrapped else token.encode()
+            new_token = _worker_keyring.rotate(raw)
+            rotated.append(base64.b64encode(new_token).decode() if wrapped else new_token.decode())
+        except (ValueError, InvalidToken):
+            rotated.append(token)
+            failed += 1
+    return rotated, failed
+
+def _read_batches(f, batch_size):
+    while True:
+        batch = list(itertools.islice(f, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def reencrypt_file(input_path, output_path, active_key, retired_keys, workers=None,
+                   batch_size=REENCRYPT_BATCH_SIZE, progress=None):
+    """
+    Streams tokens (one per line) from `input_path` through a process pool and writes them, in
+    order, re-encrypted under `active_key` to `output_path`. At most two batches per worker are in
+    flight, so memory does not grow with the file. Returns the final stats dict.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {"tokens": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    with open(input_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_reencrypt_worker,
+                                initargs=(active_key, list(retired_keys))) as pool:
+        pending = []
+        batches = _read_batches(src, batch_size)
+        while True:
+            while len(pending) < workers * 2:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append((sum(len(line) for line in batch), pool.submit(_reencrypt_batch, batch)))
+            if not pending:
+                break
+            size, future = pending.pop(0)
+            rotated, failed = future.result()
+            dst.writelines(token + "\n" for token in rotated)
+            stats["tokens"] += sum(1 for token in rotated if token)
+            stats["failed"] += failed
+            stats["bytes"] += size
+            stats["seconds"] = time.perf_counter() - start
+            if progress:
+                progress(stats)
+    return stats
+
+def _print_progress(stats):
+    seconds = max(stats["seconds"], 1e-9)
+    print(f"{stats['tokens']} tokens ({stats['failed']} failed), "
+          f"{stats['tokens'] / seconds:.0f} tokens/s, {stats['bytes'] / 1e6 / seconds:.1f} MB/s",
+          file=sys.stderr)
+
+class _GeneratedReader:
+    """File-like body of `size` bytes produced on demand, so the benchmark never holds the payload."""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.block = os.urandom(STREAM_CHUNK_BYTES)
+
+    def read(self, n=-1):
+        n = self.remaining if n is None or n < 0 else min(n, self.remaining)
+        self.remaining -= n
+        return (self.block * (n // len(self.block) + 1))[:n]
+
+class _IterReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def read(self, n=-1):
+        while n < 0 or len(self.buffer) < n:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data, self.buffer = (self.buffer, b"") if n < 0 else (self.buffer[:n], self.buffer[n:])
+        return data
+
+def _post_stream(path, body, key):
+    """Runs a streaming request straight through WSGI with an unsized body and returns the body iterator."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    environ = EnvironBuilder(path=path, method="POST", content_type=STREAM_CONTENT_TYPE,
+                             headers={STREAM_KEY_HEADER: key}).get_environ()
+    environ.pop("CONTENT_LENGTH", None)
+    environ["wsgi.input"] = body
+    environ["wsgi.input_terminated"] = True
+    app_iter, status, _ = run_wsgi_app(app.wsgi_app, environ, buffered=False)
+    if not status.startswith("200"):
+        raise RuntimeError(f"{path} failed: {status} {b''.join(app_iter)!r}")
+    return app_iter
+
+def _benchmark_run(mode, size):
+    import queue
+    import resource
+
+    client = app.test_client()
+    key = Fernet.generate_key().decode()
+    if mode == "json":
+        text = base64.b64encode(_GeneratedReader(size * 3 // 4).read()).decode()
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "json":
+        encrypted = client.post("/encrypt", json={"data": text, "key": key}).get_json()["encrypted_data"]
+        decrypted = client.post("/decrypt", json={"encrypted_data": encrypted, "key": key}).get_json()["decrypted_data"]
+        ok = decrypted == text
+    else:
+        # Each streamed response holds its own request context, so the encrypt side runs on a
+        # thread and hands frames over through a small queue.
+        frames = queue.Queue(maxsize=8)
+
+        def produce():
+            for frame in _post_stream("/encrypt", _GeneratedReader(size), key):
+                frames.put(frame)
+            frames.put(None)
+
+        threading.Thread(target=produce, daemon=True).start()
+        decrypted = _post_stream("/decrypt", _IterReader(iter(frames.get, None)), key)
+        ok = sum(len(chunk) for chunk in decrypted) == size
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"mode": mode, "ok": ok, "megabytes": round(size / 1e6, 1), "seconds": round(elapsed, 3),
+            "mb_per_second": round(size / 1e6 / elapsed, 1),
+            "peak_rss_mb": round(peak_rss / 1024, 1), "rss_growth_mb": round((peak_rss - baseline_rss) / 1024, 1)}
+
+def benchmark(size_mb=64):
+    """Round-trips `size_mb` through each path in a fresh interpreter so peak RSS is per path."""
+    import subprocess
+
+    results = []
+    for mode in ("json", "stream"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "benchmark-run", mode,
+                                 str(int(size_mb * 1e6))], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        for result in benchmark(float(sys.argv[2]) if len(sys.argv) > 2 else 64):
+            print(json.dumps(result))
+        sys.exit(0)
+    if len(sys.argv) > 3 and sys.argv[1] == "reencrypt":
+        if not ACTIVE_ENCRYPTION_KEY:
+            print("Set ACTIVE_ENCRYPTION_KEY (and RETIRED_ENCRYPTION_KEYS) to re-encrypt")
+            sys.exit(1)
+        stats = reencrypt_file(sys.argv[2], sys.argv[3], ACTIVE_ENCRYPTION_KEY, RETIRED_ENCRYPTION_KEYS,
+                               int(sys.argv[4]) if len(sys.argv) > 4 else None, progress=_print_progress)
+        print(json.dumps(stats))
+        sys.exit(1 if stats["failed"] else 0)
+    if len(sys.argv) > 3 and sys.argv[1] == "benchmark-run":
+        print(json.dumps(_benchmark_run(sys.argv[2], int(sys.argv[3]))))
+        sys.exit(0)
+
     app.run(host="0.0.0.0", port=5000)
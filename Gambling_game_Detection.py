@@ -2,45 +2,102 @@
 Flask API to detect if a game involves gambling based on metadata.
 three key indicators: betting/wagering, randomness, and rewards.
 Returns whether the game is gambling and handles invalid or missing metadata.
-Endpoint: `/detect_gambling_game`
+Endpoints: `/detect_gambling_game` and `/detect_gambling_game/batch`
+Indicators, weights and the threshold come from a rule set (`GAMBLING_RULES_FILE`, JSON) that is
+compiled once and evaluated for a whole batch with one weighted matrix product.
 """
 from flask import Flask, request, jsonify
+import json
+import os
+import numpy as np
+from instrumentation import instrument_app
 
 app = Flask(__name__)
+metrics = instrument_app(app, "gambling")
+
+GAMBLING_RULES_FILE = os.environ.get("GAMBLING_RULES_FILE")
+GAMBLING_MAX_BATCH = int(os.environ.get("GAMBLING_MAX_BATCH", "10000"))
+
+DEFAULT_RULES = {
+    "indicators": {
+        "has_bet_or_wager": {"weight": 1.0, "required": True},
+        "has_randomness": {"weight": 1.0, "required": True},
+        "has_rewards": {"weight": 1.0, "required": True},
+    },
+    "threshold": 3.0,
+}
+
+def load_rules(file_path=None):
+    if not file_path:
+        return DEFAULT_RULES
+    with open(file_path, encoding="utf-8") as f:
+        return json.load(f)
 
 class GamblingDetectionAPI:
-    def __init__(self):
-        self.required_keys = ["has_bet_or_wager", "has_randomness", "has_rewards"]
+    def __init__(self, rules=None):
+        rules = rules or DEFAULT_RULES
+        indicators = rules["indicators"]
+        if not indicators:
+            raise ValueError("Rule set must define at least one indicator")
+        self.indicator_names = list(indicators)
+        self.required_keys = {name for name in self.indicator_names if indicators[name].get("required", False)}
+        self.weights = np.array([float(indicators[name].get("weight", 1.0)) for name in self.indicator_names])
+        self.defaults = [bool(indicators[name].get("default", False)) for name in self.indicator_names]
+        self.threshold = float(rules.get("threshold", self.weights.sum())) - 1e-9
 
     def validate_metadata(self, metadata):
-        for key in self.required_keys:
+        if not isinstance(metadata, dict):
+            return False, "Metadata must be an object"
+        for key in self.indicator_names:
             if key not in metadata:
-                return False, f"Missing required metadata key: {key}"
-            if not isinstance(metadata[key], bool):
+                if key in self.required_keys:
+                    return False, f"Missing required metadata key: {key}"
+            elif not isinstance(metadata[key], bool):
                 return False, f"Invalid value for key '{key}'. Expected a boolean."
         return True, "Metadata is valid"
 
+    def _indicator_row(self, metadata):
+        return [metadata.get(name, default) for name, default in zip(self.indicator_names, self.defaults)]
+
     def is_gambling_game(self, metadata):
         is_valid, error_message = self.validate_metadata(metadata)
         if not is_valid:
             raise ValueError(error_message)
 
-        has_bet_or_wager = metadata.get("has_bet_or_wager", False)
-        has_randomness = metadata.get("has_randomness", False)
-        has_rewards = metadata.get("has_rewards", False)
+        score = float(np.dot(self._indicator_row(metadata), self.weights))
+        return bool(score >= self.threshold)
+
+    def score_batch(self, records):
+        results = [None] * len(records)
+        rows, positions = [], []
+        for i, metadata in enumerate(records):
+            is_valid, error_message = self.validate_metadata(metadata)
+            if not is_valid:
+                results[i] = {"index": i, "error": error_message, "is_gambling_game": False}
+                continue
+            rows.append(self._indicator_row(metadata))
+            positions.append(i)
+        if rows:
+            scores = np.asarray(rows, dtype=bool).astype(np.float64) @ self.weights
+            verdicts = scores >= self.threshold
+            for i, score, verdict in zip(positions, scores.tolist(), verdicts.tolist()):
+                results[i] = {"index": i, "is_gambling_game": verdict, "score": score}
+        for i, metadata in enumerate(records):
+            if isinstance(metadata, dict) and "game_id" in metadata:
+                results[i]["game_id"] = metadata["game_id"]
+        return results
 
-        return has_bet_or_wager and has_randomness and has_rewards
+gambling_detector = GamblingDetectionAPI(load_rules(GAMBLING_RULES_FILE))
 
 @app.route('/detect_gambling_game', methods=['POST'])
 def detect_gambling_game_api():
     data = request.get_json()
-    
+
     if 'metadata' not in data:
         return jsonify({"error": "Game metadata is required"}), 400
-    
+
     metadata = data['metadata']
-    gambling_detector = GamblingDetectionAPI()
-    
+
     try:
         is_gambling = gambling_detector.is_gambling_game(metadata)
         return jsonify({
@@ -54,5 +111,25 @@ def detect_gambling_game_api():
             "message": "Gambling detection failed due to invalid metadata."
         }), 400
 
+@app.route('/detect_gambling_game/batch', methods=['POST'])
+def detect_gambling_game_batch_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('games'), list):
+        return jsonify({"error": "A 'games' array of metadata records is required"}), 400
+
+    games = data['games']
+    if len(games) > GAMBLING_MAX_BATCH:
+        return jsonify({"error": f"Batch too large. At most {GAMBLING_MAX_BATCH} games per request."}), 413
+
+    with metrics.stage("score_batch"):
+        results = gambling_detector.score_batch(games)
+    failed = sum(1 for result in results if "error" in result)
+    return jsonify({
+        "results": results,
+        "processed": len(results),
+        "failed": failed,
+        "message": "Gambling detection completed successfully."
+    })
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
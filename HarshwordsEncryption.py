@@ -1,53 +1,374 @@
 """
 Flask API to filter swear words from input text. Replaces swear words with '***'
-Endpoint: /filter_swear_words
+Endpoints: /filter_swear_words, /filter_swear_words/batch (JSON array of messages)
+and /filter_swear_words/stream (NDJSON, filtered line by line as the body arrives).
 Validates input and returns filtered text with a success message.
-Needs a CSV file (`harshwords.txt`) containing swear words.
+Needs a one-column CSV file (`SWEAR_WORDS_FILE`) containing swear words.
+The matcher is built at import time and cached on disk by the file's content hash and cache format;
+from the first request on (or the gateway warm-up), the file is watched and a rebuilt matcher is
+swapped in atomically when it changes.
+Matching runs on a trie automaton that tolerates '-', '*' and digits between letters.
+Run `python HarshwordsEncryption.py benchmark` to compare it with the regex path.
 """
-from flask import Flask, request, jsonify
-import pandas as pd
+from flask import Flask, Response, request, jsonify, stream_with_context
+import csv
+import hashlib
+import json
+import pickle
 import re
 import os
+import sys
+import threading
+import time
+from instrumentation import instrument_app
 
 app = Flask(__name__)
+metrics = instrument_app(app, "swear")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SWEAR_WORDS_FILE = os.environ.get("SWEAR_WORDS_FILE", os.path.join(BASE_DIR, "combined_words_file.csv"))
+SWEAR_CACHE_DIR = os.environ.get("SWEAR_CACHE_DIR", os.path.join(BASE_DIR, ".swear_cache"))
+SWEAR_WORDS_RELOAD_SECONDS = float(os.environ.get("SWEAR_WORDS_RELOAD_SECONDS", "2"))
+# Bump when SwearMatcher's pickled layout or matching behaviour changes, so old cache files are ignored.
+SWEAR_CACHE_FORMAT = 2
+
+OBFUSCATION_CHARS = frozenset("-*0123456789")
 
 def load_swear_words(file_path):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Swear words file not found: {file_path}")
-    df = pd.read_csv(file_path)
-    return set(df['Sentences'].str.lower().str.strip())
+    with open(file_path, newline="", encoding="utf-8") as f:
+        return parse_swear_words(f.read())
 
-def create_swear_patterns(swear_words):
+def parse_swear_words(content):
+    rows = csv.reader(content.splitlines())
+    next(rows, None)
+    return {row[0].lower().strip() for row in rows if row and row[0].strip()}
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+def _fold(ch):
+    lowered = ch.lower()
+    return lowered if len(lowered) == 1 else ch
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+class SwearMatcher:
+    """
+    Trie automaton equivalent to the obfuscation-tolerant regex alternation.
+    Every word is `\\b` + its letters with `[\\-\\*0-9]*` around each one + `\\b`.
+    The scan keeps one live thread per trie node (the leftmost start wins),
+    so the cost per character depends on the live threads, not the list size.
+    Among matches at the same start the longest one is replaced.
+    """
+
+    def __init__(self, swear_words):
+        self.root = _TrieNode()
+        self.size = 0
+        for word in swear_words:
+            if not isinstance(word, str) or not word:
+                continue
+            node = self.root
+            for ch in word:
+                node = node.children.setdefault(_fold(ch), _TrieNode())
+            if not node.terminal:
+                node.terminal = True
+                self.size += 1
+
+    def finditer(self, text):
+        n = len(text)
+        folded = [_fold(ch) for ch in text]
+        word = [_is_word_char(ch) for ch in text]
+        root = self.root
+        pos = 0
+        while pos < n:
+            active = {}
+            best_start = best_end = -1
+            i = pos
+            while True:
+                boundary = (i > 0 and word[i - 1]) != (i < n and word[i])
+                if best_start < 0 and boundary and root not in active:
+                    active[root] = i
+                if boundary:
+                    for node, start in active.items():
+                        if node.terminal and (best_start < 0 or start < best_start
+                                              or (start == best_start and i > best_end)):
+                            best_start, best_end = start, i
+                if best_start >= 0:
+                    active = {node: start for node, start in active.items() if start <= best_start}
+                if i == n or (best_start >= 0 and not active):
+                    break
+                ch = folded[i]
+                skippable = ch in OBFUSCATION_CHARS
+                advanced = {}
+                for node, start in active.items():
+                    child = node.children.get(ch)
+                    if child is not None and advanced.get(child, n + 1) > start:
+                        advanced[child] = start
+                    if skippable and advanced.get(node, n + 1) > start:
+                        advanced[node] = start
+                active = advanced
+                i += 1
+            if best_start < 0:
+                return
+            yield best_start, best_end
+            pos = best_end if best_end > best_start else best_start + 1
+
+    def sub(self, repl, text):
+        pieces = []
+        last = 0
+        for start, end in self.finditer(text):
+            pieces.append(text[last:start])
+            pieces.append(repl)
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+def create_swear_regex(swear_words):
     patterns = []
     for word in swear_words:
-        escaped_word = re.escape(word)
-        pattern = r'\b' + escaped_word.replace('', r'[\-\*0-9]*') + r'\b'
+        pattern = r'\b[\-\*0-9]*' + r'[\-\*0-9]*'.join(re.escape(ch) for ch in word) + r'[\-\*0-9]*\b'
         patterns.append(pattern)
     return re.compile('|'.join(patterns), re.IGNORECASE)
 
+def create_swear_patterns(swear_words):
+    return SwearMatcher(swear_words)
+
+def load_swear_pattern(file_path, cache_dir=SWEAR_CACHE_DIR):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Swear words file not found: {file_path}")
+    with open(file_path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{digest}.v{SWEAR_CACHE_FORMAT}.pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f), digest
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+
+    pattern = create_swear_patterns(parse_swear_words(content.decode("utf-8")))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(pattern, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write swear pattern cache: {e}")
+    return pattern, digest
+
+class SwearWordsWatcher(threading.Thread):
+    """Polls the word file and swaps in a rebuilt matcher when its content changes."""
+
+    def __init__(self, file_path, digest, interval=SWEAR_WORDS_RELOAD_SECONDS):
+        super().__init__(daemon=True)
+        self.file_path = file_path
+        self.digest = digest
+        self.interval = interval
+        self.stat_key = self._stat_key()
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.file_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def check(self):
+        global swear_pattern
+        stat_key = self._stat_key()
+        if stat_key is None or stat_key == self.stat_key:
+            return False
+        try:
+            pattern, digest = load_swear_pattern(self.file_path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            # stat_key is left as is, so a partially written file is retried on the next poll.
+            print(f"Swear words reload failed: {e}")
+            return False
+        self.stat_key = stat_key
+        if digest == self.digest:
+            return False
+        self.digest = digest
+        swear_pattern = pattern
+        print(f"Reloaded {pattern.size} swear words from {self.file_path}")
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
 def filter_swear_words(input_text, swear_pattern):
     return swear_pattern.sub('***', input_text)
 
+def filter_swear_words_with_matches(input_text, swear_pattern):
+    matches = list(swear_pattern.finditer(input_text))
+    pieces = []
+    last = 0
+    for start, end in matches:
+        pieces.append(input_text[last:start])
+        pieces.append('***')
+        last = end
+    pieces.append(input_text[last:])
+    return ''.join(pieces), [{"start": start, "end": end} for start, end in matches]
+
+def filter_message(message, swear_pattern):
+    if not isinstance(message, str):
+        return {"error": "Message must be a string"}
+    filtered_text, matches = filter_swear_words_with_matches(message, swear_pattern)
+    return {"filtered_text": filtered_text, "matches": matches}
+
+def filter_ndjson_lines(lines, swear_pattern):
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            result = {"error": "Invalid JSON line"}
+        else:
+            if isinstance(record, dict) and 'text' in record:
+                result = filter_message(record['text'], swear_pattern)
+                if 'id' in record:
+                    result["id"] = record['id']
+            elif isinstance(record, str):
+                result = filter_message(record, swear_pattern)
+            else:
+                result = {"error": "Each line must be a string or an object with a 'text' field"}
+        result["line"] = line_number
+        yield json.dumps(result) + "\n"
+
+def _read_lines(stream):
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+        yield line.decode("utf-8", errors="replace")
+
+def load_benchmark_corpus(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        return [line.rstrip("\n").split("\t")[0] for line in f if line.strip()]
+
+def benchmark(swear_words_file, corpus_file, repeat=3):
+    swear_words = load_swear_words(swear_words_file)
+    corpus = load_benchmark_corpus(corpus_file)
+    total_chars = sum(len(text) for text in corpus)
+    results = {}
+    outputs = {}
+    for name, build in (("regex", create_swear_regex), ("automaton", create_swear_patterns)):
+        build_start = time.perf_counter()
+        pattern = build(swear_words)
+        build_seconds = time.perf_counter() - build_start
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = [filter_swear_words(text, pattern) for text in corpus]
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results[name] = {
+            "build_seconds": round(build_seconds, 4),
+            "best_seconds": round(best, 4),
+            "messages_per_second": round(len(corpus) / best, 1),
+            "chars_per_second": round(total_chars / best, 1),
+        }
+    mismatches = [i for i, (a, b) in enumerate(zip(outputs["regex"], outputs["automaton"])) if a != b]
+    results["corpus"] = {"messages": len(corpus), "chars": total_chars, "swear_words": len(swear_words)}
+    results["mismatched_messages"] = len(mismatches)
+    return results, [(corpus[i], outputs["regex"][i], outputs["automaton"][i]) for i in mismatches[:10]]
+
+try:
+    swear_pattern, _swear_digest = load_swear_pattern(SWEAR_WORDS_FILE)
+except FileNotFoundError as e:
+    print(e)
+    swear_pattern, _swear_digest = None, None
+
+swear_words_watcher = SwearWordsWatcher(SWEAR_WORDS_FILE, _swear_digest)
+_watcher_lock = threading.Lock()
+
+def start_watching():
+    """Starts the reload thread once, on the first request or warm-up rather than at import."""
+    if os.environ.get("SWEAR_WORDS_WATCH", "1") != "1" or swear_words_watcher.ident is not None:
+        return
+    with _watcher_lock:
+        if swear_words_watcher.ident is None:
+            swear_words_watcher.start()
+
+@app.before_request
+def _ensure_watching():
+    start_watching()
+
+def _pattern_unavailable():
+    return jsonify({"error": "Swear words list is not loaded"}), 503
+
 @app.route('/filter_swear_words', methods=['POST'])
 def filter_swear_words_api():
+    pattern = swear_pattern
+    if pattern is None:
+        return _pattern_unavailable()
     data = request.get_json()
     if 'text' not in data:
         return jsonify({"error": "Text field is required"}), 400
 
     input_text = data['text']
-    filtered_text = filter_swear_words(input_text, swear_pattern)
+    with metrics.stage("filter"):
+        filtered_text = filter_swear_words(input_text, pattern)
     return jsonify({
         "filtered_text": filtered_text,
         "message": "Swear words filtered successfully."
     })
 
+@app.route('/filter_swear_words/batch', methods=['POST'])
+def filter_swear_words_batch_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'messages' not in data:
+        return jsonify({"error": "Messages field is required"}), 400
+
+    messages = data['messages']
+    if not isinstance(messages, list):
+        return jsonify({"error": "Messages must be an array"}), 400
+
+    pattern = swear_pattern
+    if pattern is None:
+        return _pattern_unavailable()
+    with metrics.stage("filter_batch"):
+        results = [filter_message(message, pattern) for message in messages]
+    return jsonify({
+        "results": results,
+        "message": "Swear words filtered successfully."
+    })
+
+@app.route('/filter_swear_words/stream', methods=['POST'])
+def filter_swear_words_stream_api():
+    pattern = swear_pattern
+    if pattern is None:
+        return _pattern_unavailable()
+    lines = _read_lines(request.stream)
+    return Response(stream_with_context(filter_ndjson_lines(lines, pattern)),
+                    mimetype="application/x-ndjson")
+
 if __name__ == "__main__":
-    swear_words_file = "harshwords.txt"
-    try:
-        swear_words_set = load_swear_words(swear_words_file)
-        swear_pattern = create_swear_patterns(swear_words_set)
-    except FileNotFoundError as e:
-        print(e)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        words_file = sys.argv[2] if len(sys.argv) > 2 else SWEAR_WORDS_FILE
+        corpus_file = sys.argv[3] if len(sys.argv) > 3 else "hate_speech.tsv"
+        results, examples = benchmark(words_file, corpus_file)
+        for name, value in results.items():
+            print(f"{name}: {value}")
+        for text, regex_out, automaton_out in examples:
+            print(f"MISMATCH\n  input:     {text}\n  regex:     {regex_out}\n  automaton: {automaton_out}")
+        sys.exit(0)
+
+    if swear_pattern is None:
         exit(1)
 
+    start_watching()
     app.run(host="0.0.0.0", port=5000)
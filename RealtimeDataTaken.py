@@ -1,76 +1,335 @@
 """
 Flask API to monitor system resource usage in real-time.
 Tracks camera, microphone, photos access, CPU, and memory usage.
-Endpoint: /status.
+Endpoints: /status, /history.
 Uses threading for continuous system resource monitoring.
 Supports cross-platform.
+All probes run in the background monitor thread, each on its own interval (`*_PROBE_SECONDS`);
+/status serves the latest snapshot together with the time each value was sampled.
+CPU, memory and per-process samples are also kept in a fixed-size ring buffer for /history.
+OpenCV and PyAudio are imported by the camera and microphone probes, not at module import.
 """
+import logging
 import os
+import numpy as np
 import psutil
-import cv2
-import pyaudio
 import time
 import threading
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
+from instrumentation import REGISTRY, instrument_app
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = Observer = None
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+metrics = instrument_app(app, "resources")
+probe_failures = REGISTRY.counter("safegaming_probe_failures_total", "Resource probes that raised.", ("probe",))
+
+PHOTOS_DIR = os.path.expanduser("~/Pictures")
+PROBE_INTERVALS = {
+    "camera": float(os.environ.get("CAMERA_PROBE_SECONDS", "30")),
+    "microphone": float(os.environ.get("MICROPHONE_PROBE_SECONDS", "30")),
+    "photos": float(os.environ.get("PHOTOS_PROBE_SECONDS", "10")),
+    "system": float(os.environ.get("SYSTEM_PROBE_SECONDS", "5")),
+}
+
+HISTORY_CAPACITY = int(os.environ.get("HISTORY_CAPACITY", "17280"))
+HISTORY_PROCESS_NAMES = [name.strip() for name in os.environ.get("HISTORY_PROCESS_NAMES", "").split(",") if name.strip()]
 
 resource_status = {
     "camera": "Not in use",
     "microphone": "Not in use",
     "photos": "Not in use",
     "cpu_usage": "0%",
-    "memory_usage": "0%"
+    "memory_usage": "0%",
+    "cpu_percent": 0.0,
+    "memory_percent": 0.0,
+    "sampled_at": {},
+    "probe_errors": {},
 }
 
+class SampleRing:
+    """Fixed-capacity ring of timestamped rows, one float column per series."""
+
+    def __init__(self, series, capacity=HISTORY_CAPACITY):
+        self.series = list(series)
+        self.capacity = capacity
+        self.timestamps = np.full(capacity, np.nan)
+        self.values = np.full((capacity, len(self.series)), np.nan, dtype=np.float32)
+        self.next = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, row):
+        with self.lock:
+            self.timestamps[self.next] = timestamp
+            self.values[self.next] = row
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def window(self, seconds=None, now=None):
+        with self.lock:
+            if self.count < self.capacity:
+                timestamps = self.timestamps[:self.count].copy()
+                values = self.values[:self.count].copy()
+            else:
+                timestamps = np.concatenate([self.timestamps[self.next:], self.timestamps[:self.next]])
+                values = np.concatenate([self.values[self.next:], self.values[:self.next]])
+        if seconds is not None:
+            start = np.searchsorted(timestamps, (now or time.time()) - seconds)
+            timestamps, values = timestamps[start:], values[start:]
+        return timestamps, values
+
+    def aggregate(self, seconds=None, now=None):
+        timestamps, values = self.window(seconds, now)
+        if not len(timestamps):
+            return {name: None for name in self.series}
+        stats = np.vstack([
+            np.nanmin(values, axis=0),
+            np.nanmean(values, axis=0),
+            np.nanmax(values, axis=0),
+            np.nanpercentile(values, 95, axis=0),
+        ])
+        return {
+            name: {"min": float(stats[0, i]), "avg": float(stats[1, i]), "max": float(stats[2, i]),
+                   "p95": float(stats[3, i]), "samples": int(len(timestamps))}
+            for i, name in enumerate(self.series)
+        }
+
+HISTORY_SERIES = ["cpu_percent", "memory_percent", "self_cpu_percent", "self_rss_mb"]
+for _name in HISTORY_PROCESS_NAMES:
+    HISTORY_SERIES += [f"process:{_name}:cpu_percent", f"process:{_name}:rss_mb"]
+
+resource_history = SampleRing(HISTORY_SERIES)
+_self_process = psutil.Process()
+
 def check_camera_usage():
+    import cv2
+
     cap = cv2.VideoCapture(0)
-    if cap.isOpened():
-        resource_status["camera"] = "Camera is being used"
-    else:
-        resource_status["camera"] = "Camera is not in use"
-    cap.release()
+    try:
+        if cap.isOpened():
+            return {"camera": "Camera is being used"}
+        return {"camera": "Camera is not in use"}
+    finally:
+        cap.release()
 
 def check_microphone_usage():
+    import pyaudio
+
     audio = pyaudio.PyAudio()
-    for i in range(audio.get_device_count()):
-        device_info = audio.get_device_info_by_index(i)
-        if device_info["maxInputChannels"] > 0 and "microphone" in device_info["name"].lower():
-            resource_status["microphone"] = "Microphone is being used"
-            break
-    else:
-        resource_status["microphone"] = "Microphone is not in use"
+    try:
+        for i in range(audio.get_device_count()):
+            device_info = audio.get_device_info_by_index(i)
+            if device_info["maxInputChannels"] > 0 and "microphone" in device_info["name"].lower():
+                return {"microphone": "Microphone is being used"}
+        return {"microphone": "Microphone is not in use"}
+    finally:
+        audio.terminate()
+
+class NewestPhotoTracker:
+    """
+    Tracks the most recently modified entry in the photos directory.
+    Uses a watchdog observer when the package is installed, otherwise one os.scandir pass per probe.
+    """
+
+    def __init__(self, photos_dir):
+        self.photos_dir = photos_dir
+        self.newest = None
+        self.dirty = True
+        self.lock = threading.Lock()
+        self.observer = None
+
+    def scan(self):
+        newest = None
+        with os.scandir(self.photos_dir) as entries:
+            for entry in entries:
+                try:
+                    # Like the watcher, only regular files count as photos.
+                    if not entry.is_file():
+                        continue
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if newest is None or mtime > newest[1]:
+                    newest = (entry.path, mtime)
+        with self.lock:
+            self.newest = newest
+            self.dirty = False
+
+    def _touched(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        with self.lock:
+            if self.newest is None or mtime >= self.newest[1]:
+                self.newest = (path, mtime)
+
+    def _removed(self, path):
+        with self.lock:
+            if self.newest is not None and self.newest[0] == path:
+                self.dirty = True
+
+    def start_watching(self):
+        if Observer is None or self.observer is not None or not os.path.isdir(self.photos_dir):
+            return False
+        tracker = self
+
+        class Handler(FileSystemEventHandler):
+            # Directory events (including the folder's own mtime changing) are never photos.
+            def on_created(self, event):
+                if not event.is_directory:
+                    tracker._touched(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    tracker._touched(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    tracker._removed(event.src_path)
+                    tracker._touched(event.dest_path)
+
+            def on_deleted(self, event):
+                if not event.is_directory:
+                    tracker._removed(event.src_path)
+
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.schedule(Handler(), self.photos_dir, recursive=False)
+        self.observer.start()
+        return True
+
+    def newest_photo(self):
+        if self.observer is None or self.dirty:
+            self.scan()
+        return self.newest
+
+photo_tracker = NewestPhotoTracker(PHOTOS_DIR)
 
 def check_photos_access():
-    photos_dir = os.path.expanduser("~/Pictures")
-    if os.path.exists(photos_dir):
-        recent_files = sorted(
-            [os.path.join(photos_dir, f) for f in os.listdir(photos_dir)],
-            key=os.path.getmtime,
-            reverse=True
-        )
-        if recent_files:
-            resource_status["photos"] = f"Photos accessed recently: {recent_files[0]}"
-        else:
-            resource_status["photos"] = "No recent photo access"
-    else:
-        resource_status["photos"] = "Photos directory not found"
+    if not os.path.exists(photo_tracker.photos_dir):
+        return {"photos": "Photos directory not found"}
+    newest = photo_tracker.newest_photo()
+    if newest:
+        return {"photos": f"Photos accessed recently: {newest[0]}"}
+    return {"photos": "No recent photo access"}
+
+def sample_processes():
+    totals = {name: [0.0, 0.0] for name in HISTORY_PROCESS_NAMES}
+    if totals:
+        for proc in psutil.process_iter(["name", "cpu_percent", "memory_info"]):
+            total = totals.get(proc.info["name"])
+            if total is not None and proc.info["memory_info"] is not None:
+                total[0] += proc.info["cpu_percent"] or 0.0
+                total[1] += proc.info["memory_info"].rss / (1024 * 1024)
+    row = []
+    for name in HISTORY_PROCESS_NAMES:
+        row += totals[name]
+    return row
+
+def check_system_usage():
+    cpu_percent = psutil.cpu_percent()
+    memory_percent = psutil.virtual_memory().percent
+    row = [cpu_percent, memory_percent, _self_process.cpu_percent(),
+           _self_process.memory_info().rss / (1024 * 1024)] + sample_processes()
+    resource_history.append(time.time(), row)
+    return {
+        "cpu_usage": f"{cpu_percent}%",
+        "memory_usage": f"{memory_percent}%",
+        "cpu_percent": cpu_percent,
+        "memory_percent": memory_percent,
+    }
+
+PROBES = {
+    "camera": check_camera_usage,
+    "microphone": check_microphone_usage,
+    "photos": check_photos_access,
+    "system": check_system_usage,
+}
+
+def run_due_probes(next_run, now):
+    global resource_status
+    updates = {}
+    sampled_at = dict(resource_status["sampled_at"])
+    probe_errors = dict(resource_status["probe_errors"])
+    for name, probe in PROBES.items():
+        if next_run.get(name, 0) > now:
+            continue
+        next_run[name] = now + PROBE_INTERVALS[name]
+        try:
+            with metrics.stage(f"probe_{name}"):
+                updates.update(probe())
+        except Exception as e:
+            logger.warning("%s probe failed: %s", name, e)
+            probe_failures.inc((name,))
+            probe_errors[name] = {"error": str(e), "failed_at": time.time()}
+            continue
+        sampled_at[name] = time.time()
+        probe_errors.pop(name, None)
+    if updates or sampled_at != resource_status["sampled_at"] or probe_errors != resource_status["probe_errors"]:
+        snapshot = dict(resource_status)
+        snapshot.update(updates)
+        snapshot["sampled_at"] = sampled_at
+        snapshot["probe_errors"] = probe_errors
+        resource_status = snapshot
 
 def check_system_resources():
+    photo_tracker.start_watching()
+    next_run = {}
     while True:
-        resource_status["cpu_usage"] = f"{psutil.cpu_percent()}%"
-        resource_status["memory_usage"] = f"{psutil.virtual_memory().percent}%"
-        time.sleep(5)
+        now = time.monotonic()
+        run_due_probes(next_run, now)
+        time.sleep(max(0.05, min(next_run.values()) - time.monotonic()))
+
+_monitor_thread = None
+_monitor_lock = threading.Lock()
+
+def start_monitor():
+    global _monitor_thread
+    with _monitor_lock:
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=check_system_resources)
+            _monitor_thread.daemon = True
+            _monitor_thread.start()
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    check_camera_usage()
-    check_microphone_usage()
-    check_photos_access()
+    start_monitor()
     return jsonify(resource_status)
 
+@app.route('/history', methods=['GET'])
+def get_history():
+    start_monitor()
+    try:
+        window = float(request.args["window"]) if "window" in request.args else None
+    except ValueError:
+        return jsonify({"error": "Window must be a number of seconds"}), 400
+    series = request.args.get("series")
+    names = series.split(",") if series else resource_history.series
+    unknown = [name for name in names if name not in resource_history.series]
+    if unknown:
+        return jsonify({"error": f"Unknown series: {', '.join(unknown)}",
+                        "available_series": resource_history.series}), 400
+
+    if request.args.get("aggregate", "0") == "1":
+        aggregates = resource_history.aggregate(window)
+        return jsonify({"window_seconds": window, "aggregates": {name: aggregates[name] for name in names}})
+
+    timestamps, values = resource_history.window(window)
+    columns = [resource_history.series.index(name) for name in names]
+    return jsonify({
+        "window_seconds": window,
+        "timestamps": timestamps.tolist(),
+        "series": {name: values[:, column].tolist() for name, column in zip(names, columns)},
+    })
+
 if __name__ == "__main__":
-    monitor_thread = threading.Thread(target=check_system_resources)
-    monitor_thread.daemon = True
-    monitor_thread.start()
+    start_monitor()
     app.run(host="0.0.0.0", port=5000)
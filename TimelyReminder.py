@@ -4,23 +4,391 @@ The Default Timer sends periodic reminders to take breaks, while the Parental Ti
 After each timer session, the user is prompted to enter a password to continue or exit.
 The application uses Flask to handle HTTP requests and runs in the background while accepting user input in the terminal.
 The program loops until the user chooses to exit, supporting multiple rounds of playtime with password verification.
+Timers for every player live in one scheduler thread driven by a min-heap, so each wake-up costs O(log n).
+Endpoints: /start_game_timer (POST), /get_reminders (GET), /sessions/<user_id> (GET, DELETE),
+/sessions/<user_id>/pause, /resume, /extend and /cancel (POST),
+/reminders/stream (GET, Server-Sent Events pushed as reminders fire).
+Session state is written to an append-only journal (`REMINDER_JOURNAL`) that is compacted
+periodically, so a restart resumes every timer with its remaining time.
 """
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import heapq
+import itertools
+import json
+import queue
 import time
 import threading
 import getpass
 import os
+from instrumentation import instrument_app
 
 app = Flask(__name__)
+metrics = instrument_app(app, "timer")
 user_timers = {}
-user_id = "player1"
+user_id = os.environ.get("PLAYER_ID", "player1")
 custom_message = "Take a break and stretch your legs!"
 password = "securePassword"
 
+REMINDER_JOURNAL = os.environ.get("REMINDER_JOURNAL", "reminder_journal.jsonl")
+REMINDER_JOURNAL_COMPACT_EVERY = int(os.environ.get("REMINDER_JOURNAL_COMPACT_EVERY", "1000"))
+REMINDER_RETAIN_SECONDS = float(os.environ.get("REMINDER_RETAIN_SECONDS", str(24 * 3600)))
+SSE_HEARTBEAT_SECONDS = 15
+SSE_CLIENT_QUEUE_SIZE = 100
+SESSION_FIELDS = ("user_id", "mode", "interval_seconds", "max_reminders", "play_duration_seconds", "message",
+                  "status", "reminders", "reminder_count", "started_at", "remaining_seconds", "generation")
+
 def reminder_message(play_duration_seconds):
-    minutes, seconds = divmod(play_duration_seconds, 60)
+    minutes, seconds = divmod(int(play_duration_seconds), 60)
     return f"It's been {minutes} minute(s) and {seconds} second(s) since you started playing. {custom_message}" if minutes > 0 else f"It's been {seconds} second(s) since you started playing. {custom_message}"
 
+class ReminderJournal:
+    """
+    Append-only JSON-lines log of session snapshots; the last line per user wins on replay.
+    `compact` rewrites it with one line per live session.
+    """
+
+    def __init__(self, path, compact_every=REMINDER_JOURNAL_COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+        self.appended = 0
+        self.file = None
+
+    def load(self):
+        states = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        state = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(state, dict) and "user_id" in state:
+                        states[state["user_id"]] = state
+        except OSError:
+            pass
+        return states
+
+    def append(self, state):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps(state) + "\n")
+        self.file.flush()
+        self.appended += 1
+
+    def should_compact(self):
+        return self.appended >= self.compact_every
+
+    def compact(self, states):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for state in states:
+                f.write(json.dumps(state) + "\n")
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        os.replace(tmp_path, self.path)
+        self.appended = 0
+
+class ReminderBroadcaster:
+    """Fans each fired reminder out to the queues of connected stream clients (per user and catch-all)."""
+
+    def __init__(self, queue_size=SSE_CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id=None):
+        client = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(client)
+        return client
+
+    def unsubscribe(self, user_id, client):
+        with self.lock:
+            clients = self.subscribers.get(user_id)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self.subscribers[user_id]
+
+    def publish(self, event):
+        with self.lock:
+            targets = list(self.subscribers.get(event["user_id"], ())) + list(self.subscribers.get(None, ()))
+        for client in targets:
+            while True:
+                try:
+                    client.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        pass
+
+class ReminderScheduler(threading.Thread):
+    """
+    One thread for every player's timer. Pending deadlines sit in a min-heap of
+    (due, seq, user_id, generation); pausing, extending or cancelling bumps the session's
+    generation so stale heap entries are skipped when they surface.
+    """
+
+    def __init__(self, sessions, journal=None):
+        super().__init__(daemon=True)
+        self.sessions = sessions
+        self.journal = journal
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.listeners = []
+
+    def _snapshot(self, session, now, wall_now):
+        state = {field: session[field] for field in SESSION_FIELDS}
+        state["played_seconds"] = self._played(session, now)
+        state["due_at"] = wall_now + session["due"] - now if session["status"] == "running" else None
+        state["recorded_at"] = wall_now
+        return state
+
+    def _record(self, session, now):
+        if self.journal is None:
+            return
+        wall_now = time.time()
+        with metrics.stage("journal_write"):
+            self.journal.append(self._snapshot(session, now, wall_now))
+            if self.journal.should_compact():
+                self._compact(now, wall_now)
+
+    def _compact(self, now, wall_now):
+        self.journal.compact([
+            self._snapshot(session, now, wall_now) for session in self.sessions.values()
+            if session["status"] in ("running", "paused") or wall_now - session["started_at"] < REMINDER_RETAIN_SECONDS
+        ])
+
+    def restore(self):
+        if self.journal is None:
+            return 0
+        now, wall_now = time.monotonic(), time.time()
+        with self.condition:
+            for user, state in self.journal.load().items():
+                session = {field: state.get(field) for field in SESSION_FIELDS}
+                try:
+                    generation = state["generation"]
+                    if isinstance(generation, bool) or int(generation) != generation:
+                        raise ValueError(f"Bad generation {generation!r}")
+                    session["generation"] = int(generation)
+                    session["reminders"] = list(session["reminders"] or [])
+                    session["played_seconds"] = float(state.get("played_seconds", 0.0))
+                    session["resumed_at"] = now
+                    session["finished"] = threading.Event()
+                    session["due"] = now
+                    if session["status"] == "running":
+                        session["played_seconds"] += max(0.0, wall_now - state["recorded_at"])
+                        session["due"] = now + state["due_at"] - wall_now
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if session["status"] == "running":
+                    self._push(session)
+                elif session["status"] != "paused":
+                    session["finished"].set()
+                self.sessions[user] = session
+            self._compact(now, wall_now)
+            return len(self.sessions)
+
+    def _push(self, session):
+        heapq.heappush(self.heap, (session["due"], next(self.counter), session["user_id"], session["generation"]))
+        self.condition.notify()
+
+    def _played(self, session, now):
+        played = session["played_seconds"]
+        if session["status"] == "running":
+            played += now - session["resumed_at"]
+        return played
+
+    def start_session(self, user_id, mode="default", interval_seconds=None, max_reminders=None,
+                      play_duration_seconds=None, message=None):
+        if mode == "default":
+            if not interval_seconds or interval_seconds <= 0 or not max_reminders or max_reminders <= 0:
+                raise ValueError("Default timer needs positive 'interval_seconds' and 'max_reminders'")
+            delay = interval_seconds
+        elif mode == "parental":
+            if not play_duration_seconds or play_duration_seconds <= 0:
+                raise ValueError("Parental timer needs a positive 'play_duration_seconds'")
+            delay = play_duration_seconds
+        else:
+            raise ValueError("Mode must be 'default' or 'parental'")
+        now = time.monotonic()
+        with self.condition:
+            previous = self.sessions.get(user_id)
+            session = {
+                "user_id": user_id,
+                "mode": mode,
+                "interval_seconds": interval_seconds,
+                "max_reminders": max_reminders,
+                "play_duration_seconds": play_duration_seconds,
+                "message": message,
+                "status": "running",
+                "reminders": [],
+                "reminder_count": 0,
+                "started_at": time.time(),
+                "resumed_at": now,
+                "played_seconds": 0.0,
+                "due": now + delay,
+                "remaining_seconds": None,
+                "generation": previous["generation"] + 1 if previous else 0,
+                "finished": threading.Event(),
+            }
+            if previous:
+                previous["finished"].set()
+            self.sessions[user_id] = session
+            self._push(session)
+            self._record(session, now)
+            return self.view(session, now)
+
+    def pause(self, user_id):
+        now = time.monotonic()
+        with self.condition:
+            session = self._active(user_id, "running")
+            session["played_seconds"] = self._played(session, now)
+            session["remaining_seconds"] = max(0.0, session["due"] - now)
+            session["status"] = "paused"
+            session["generation"] += 1
+            self._record(session, now)
+            return self.view(session, now)
+
+    def resume(self, user_id):
+        now = time.monotonic()
+        with self.condition:
+            session = self._active(user_id, "paused")
+            session["status"] = "running"
+            session["resumed_at"] = now
+            session["due"] = now + session["remaining_seconds"]
+            session["remaining_seconds"] = None
+            session["generation"] += 1
+            self._push(session)
+            self._record(session, now)
+            return self.view(session, now)
+
+    def extend(self, user_id, seconds=0, reminders=0):
+        try:
+            whole = int(reminders)
+        except (TypeError, ValueError):
+            whole = None
+        if isinstance(reminders, bool) or whole is None or whole != reminders or whole < 0:
+            raise ValueError("'reminders' must be a non-negative whole number")
+        reminders = whole
+        now = time.monotonic()
+        with self.condition:
+            session = self._active(user_id)
+            if seconds:
+                if session["status"] == "paused":
+                    session["remaining_seconds"] += seconds
+                else:
+                    session["due"] += seconds
+                if session["mode"] == "parental":
+                    session["play_duration_seconds"] += seconds
+            if reminders and session["mode"] == "default":
+                session["max_reminders"] += reminders
+            if session["status"] == "running":
+                session["generation"] += 1
+                self._push(session)
+            self._record(session, now)
+            return self.view(session, now)
+
+    def cancel(self, user_id):
+        now = time.monotonic()
+        with self.condition:
+            session = self._active(user_id)
+            session["played_seconds"] = self._played(session, now)
+            session["status"] = "cancelled"
+            session["generation"] += 1
+            session["finished"].set()
+            self._record(session, now)
+            return self.view(session, now)
+
+    def _active(self, user_id, *statuses):
+        session = self.sessions.get(user_id)
+        if session is None:
+            raise KeyError(user_id)
+        if session["status"] not in (statuses or ("running", "paused")):
+            raise ValueError(f"Session is {session['status']}")
+        return session
+
+    def view(self, session, now=None):
+        now = time.monotonic() if now is None else now
+        if session["status"] == "running":
+            remaining = max(0.0, session["due"] - now)
+        else:
+            remaining = session["remaining_seconds"]
+        return {
+            "user_id": session["user_id"],
+            "mode": session["mode"],
+            "status": session["status"],
+            "reminders": list(session["reminders"]),
+            "reminder_count": session["reminder_count"],
+            "max_reminders": session["max_reminders"],
+            "play_duration_seconds": session["play_duration_seconds"],
+            "played_seconds": round(self._played(session, now), 3),
+            "next_reminder_in_seconds": None if remaining is None else round(remaining, 3),
+        }
+
+    def get(self, user_id):
+        with self.condition:
+            session = self.sessions.get(user_id)
+            return None if session is None else self.view(session)
+
+    def _fire(self, session, now):
+        played = self._played(session, now)
+        reminder_msg = session["message"] if session["message"] else reminder_message(played)
+        session["reminders"].append(reminder_msg)
+        session["reminder_count"] += 1
+        if session["mode"] == "default" and session["reminder_count"] < session["max_reminders"]:
+            session["due"] += session["interval_seconds"]
+            self._push(session)
+        else:
+            session["played_seconds"] = played
+            session["status"] = "time_up" if session["mode"] == "parental" else "finished"
+            session["finished"].set()
+        self._record(session, now)
+        return {"user_id": session["user_id"], "message": reminder_msg, "status": session["status"],
+                "reminder_count": session["reminder_count"]}
+
+    def run(self):
+        while True:
+            fired = []
+            with self.condition:
+                while not self.heap:
+                    self.condition.wait()
+                due, _, session_user, generation = self.heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self.condition.wait(due - now)
+                    continue
+                heapq.heappop(self.heap)
+                session = self.sessions.get(session_user)
+                if session is not None and session["generation"] == generation and session["status"] == "running":
+                    fired.append(self._fire(session, now))
+            for event in fired:
+                print(f"[{event['user_id']}] {event['message']}")
+                for listener in list(self.listeners):
+                    listener(event)
+
+reminder_broadcaster = ReminderBroadcaster()
+scheduler = ReminderScheduler(user_timers, ReminderJournal(REMINDER_JOURNAL) if REMINDER_JOURNAL else None)
+scheduler.listeners.append(reminder_broadcaster.publish)
+_scheduler_lock = threading.Lock()
+
+def start_scheduler():
+    """Replays (and compacts) the journal and starts the scheduler thread, once, when serving begins."""
+    if scheduler.is_alive():
+        return
+    with _scheduler_lock:
+        if not scheduler.is_alive():
+            scheduler.restore()
+            scheduler.start()
+
+@app.before_request
+def _ensure_scheduler():
+    start_scheduler()
+
 def ask_for_password():
     user_input = getpass.getpass("Enter the password to continue: ")
     if user_input != password:
@@ -34,38 +402,22 @@ def shutdown_flask():
     os._exit(0)
 
 def game_play_timer_default(user_id, reminder_interval_seconds, max_reminders, custom_message=None):
-    if user_id not in user_timers:
-        user_timers[user_id] = {"reminders": []}
-    
-    start_time = time.time()
-    reminder_count = 0
-    reminders = []
-
-    while reminder_count < max_reminders:
-        time.sleep(reminder_interval_seconds)
-        elapsed_time = time.time() - start_time
-        reminder_msg = custom_message if custom_message else reminder_message(elapsed_time)
-        reminders.append(reminder_msg)
-        reminder_count += 1
-        print(reminder_msg)
-        user_timers[user_id]["reminders"] = reminders
-    
+    scheduler.start_session(user_id, "default", interval_seconds=reminder_interval_seconds,
+                            max_reminders=max_reminders, message=custom_message)
+    user_timers[user_id]["finished"].wait()
     print("Reminder limit reached. Returning to main menu...")
 
 def game_play_timer_parental(user_id, play_duration_seconds, custom_message=None):
-    start_time = time.time()
-    while time.time() - start_time < play_duration_seconds:
-        time.sleep(1)
-    elapsed_time = time.time() - start_time
-    reminder_msg = custom_message if custom_message else reminder_message(elapsed_time)
-    print(reminder_msg)
+    scheduler.start_session(user_id, "parental", play_duration_seconds=play_duration_seconds,
+                            message=custom_message)
+    user_timers[user_id]["finished"].wait()
     print("Game time finished. Please enter the password to continue.")
     ask_for_password()
 
 def choose_timer():
     while True:
         choice = input("Enter '1' for Default Timer or '2' for Parental Timer: ")
-        
+
         if choice == '1':
             print("Starting Default Timer (Code 1)...")
             reminder_interval_seconds = int(input("Enter interval in seconds: "))
@@ -79,7 +431,7 @@ def choose_timer():
                 except ValueError:
                     print("Invalid input. Please enter a valid number.")
             game_play_timer_default(user_id, reminder_interval_seconds, max_reminders, custom_message)
-        
+
         elif choice == '2':
             print("Starting Parental Timer (Code 2)...")
             while True:
@@ -92,17 +444,121 @@ def choose_timer():
                 except ValueError:
                     print("Invalid input. Please enter a valid number.")
             game_play_timer_parental(user_id, play_duration_seconds, custom_message)
-        
+
         else:
             print("Invalid choice. Please enter '1' or '2'.")
 
+def _session_error(e):
+    if isinstance(e, KeyError):
+        return jsonify({"error": "No timer session for this user"}), 404
+    return jsonify({"error": str(e)}), 409
+
+def _positive_number(data, key):
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"'{key}' must be a number")
+    return value
+
+@app.route('/start_game_timer', methods=['POST'])
+def start_game_timer():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get("user_id"):
+        return jsonify({"error": "User ID is required"}), 400
+    try:
+        session = scheduler.start_session(
+            str(data["user_id"]),
+            data.get("mode", "default"),
+            interval_seconds=_positive_number(data, "interval_seconds"),
+            max_reminders=_positive_number(data, "max_reminders"),
+            play_duration_seconds=_positive_number(data, "play_duration_seconds"),
+            message=data.get("custom_message"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(session), 201
+
+@app.route('/get_reminders', methods=['GET'])
+def get_reminders():
+    session = scheduler.get(request.args.get("user_id", user_id))
+    if session is None:
+        return jsonify({"error": "No timer session for this user"}), 404
+    return jsonify({"user_id": session["user_id"], "reminders": session["reminders"], "status": session["status"]})
+
+@app.route('/sessions/<session_user>', methods=['GET'])
+def get_session(session_user):
+    session = scheduler.get(session_user)
+    if session is None:
+        return jsonify({"error": "No timer session for this user"}), 404
+    return jsonify(session)
+
+@app.route('/sessions/<session_user>/pause', methods=['POST'])
+def pause_session(session_user):
+    try:
+        return jsonify(scheduler.pause(session_user))
+    except (KeyError, ValueError) as e:
+        return _session_error(e)
+
+@app.route('/sessions/<session_user>/resume', methods=['POST'])
+def resume_session(session_user):
+    try:
+        return jsonify(scheduler.resume(session_user))
+    except (KeyError, ValueError) as e:
+        return _session_error(e)
+
+@app.route('/sessions/<session_user>/extend', methods=['POST'])
+def extend_session(session_user):
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = _positive_number(data, "seconds") or 0
+        reminders = _positive_number(data, "reminders") or 0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if seconds < 0 or reminders < 0 or not (seconds or reminders):
+        return jsonify({"error": "Provide a positive 'seconds' or 'reminders'"}), 400
+    if reminders != int(reminders):
+        return jsonify({"error": "'reminders' must be a whole number"}), 400
+    try:
+        return jsonify(scheduler.extend(session_user, seconds, reminders))
+    except (KeyError, ValueError) as e:
+        return _session_error(e)
+
+@app.route('/sessions/<session_user>/cancel', methods=['POST'])
+@app.route('/sessions/<session_user>', methods=['DELETE'])
+def cancel_session(session_user):
+    try:
+        return jsonify(scheduler.cancel(session_user))
+    except (KeyError, ValueError) as e:
+        return _session_error(e)
+
+@app.route('/reminders/stream', methods=['GET'])
+def stream_reminders():
+    stream_user = request.args.get("user_id")
+    client = reminder_broadcaster.subscribe(stream_user)
+
+    def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = client.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: reminder\ndata: {json.dumps(event)}\n\n"
+        finally:
+            reminder_broadcaster.unsubscribe(stream_user, client)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 def start_flask_server():
-    app.run(host="0.0.0.0", port=5000)
+    app.run(host="0.0.0.0", port=5000, threaded=True)
 
 if __name__ == "__main__":
-    choose_timer()
+    start_scheduler()
     flask_thread = threading.Thread(target=start_flask_server)
     flask_thread.daemon = True
     flask_thread.start()
-
-
+    choose_timer()
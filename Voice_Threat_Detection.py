@@ -3,16 +3,67 @@ It preprocesses and balances a dataset of labeled sentences.
 Uses a Sentence Transformer model to encode the sentences and calculate cosine similarity for threat detection.
 Includes evaluation metrics (accuracy, precision, recall) and exports misclassified examples.
 Supports real-time voice input for threat detection via speech recognition
+Threat sentences are deduplicated, encoded once and kept as an L2-normalised, memory-mapped
+index (`THREAT_INDEX_DIR`) tied to the dataset hash and model name.
+`python Voice_Threat_Detection.py serve` exposes `/detect_threat` (POST) and `/threat_stats` (GET);
+concurrent requests are micro-batched into one `model.encode` call behind an LRU embedding cache.
+`python Voice_Threat_Detection.py scan` runs WAV files through energy-based voice activity detection,
+a pluggable recogniser and threat scoring as concurrent stages joined by bounded queues.
+`python Voice_Threat_Detection.py evaluate` streams labelled corpora in chunks and reports metrics
+for several thresholds from one similarity pass, exporting misclassified examples as it goes.
+`THREAT_QUANTIZATION=float16|int8` scores against a quantised copy of the index (int8 with one scale per
+vector) and re-ranks the best candidates in float32; every verdict lists the `THREAT_TOP_K` closest
+reference sentences. `python Voice_Threat_Detection.py quantization` compares both with float32 on a corpus.
+pandas, scikit-learn, sentence-transformers and SpeechRecognition are imported on first use.
 """
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import speech_recognition as sr
+import numpy as np
+from flask import Flask, request, jsonify
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+import argparse
+import csv
+import hashlib
+import json
 import os
-from sklearn.utils import resample
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from instrumentation import instrument_app
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.environ.get("THREAT_DATASET", os.path.join(BASE_DIR, "mainxlsx.xlsx"))
+MODEL_NAME = os.environ.get("THREAT_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+THREAT_INDEX_DIR = os.environ.get("THREAT_INDEX_DIR", os.path.join(BASE_DIR, ".threat_index"))
+THREAT_THRESHOLD = float(os.environ.get("THREAT_THRESHOLD", "0.75"))
+THREAT_BATCH_MAX_SIZE = int(os.environ.get("THREAT_BATCH_MAX_SIZE", "32"))
+THREAT_BATCH_MAX_WAIT_MS = float(os.environ.get("THREAT_BATCH_MAX_WAIT_MS", "5"))
+THREAT_CACHE_SIZE = int(os.environ.get("THREAT_CACHE_SIZE", "10000"))
+QUANTIZATIONS = ("none", "float16", "int8")
+QUANTIZED_BLOCK_ROWS = 4096
+THREAT_QUANTIZATION = os.environ.get("THREAT_QUANTIZATION", "none")
+if THREAT_QUANTIZATION not in QUANTIZATIONS:
+    raise ValueError(f"THREAT_QUANTIZATION must be one of {', '.join(QUANTIZATIONS)}, not '{THREAT_QUANTIZATION}'")
+THREAT_TOP_K = int(os.environ.get("THREAT_TOP_K", "3"))
+THREAT_MAX_TOP_K = int(os.environ.get("THREAT_MAX_TOP_K", "20"))
+THREAT_RERANK_CANDIDATES = int(os.environ.get("THREAT_RERANK_CANDIDATES", "32"))
+QUANTIZATION_TOLERANCE = float(os.environ.get("QUANTIZATION_TOLERANCE", "0.005"))
+VAD_FRAME_MS = 30
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "64"))
+EVALUATION_THRESHOLDS = (0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9)
+
+app = Flask(__name__)
+metrics = instrument_app(app, "threats")
 
 
 def load_and_clean_dataset(file_path):
+    import pandas as pd
+
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Dataset file not found: {file_path}")
     data = pd.read_excel(file_path)
@@ -22,6 +73,9 @@ def load_and_clean_dataset(file_path):
 
 
 def balance_dataset(data):
+    import pandas as pd
+    from sklearn.utils import resample
+
     threat_data = data[data['labels'] == 'yes']
     non_threat_data = data[data['labels'] == 'no']
     threat_data_upsampled = resample(threat_data, replace=True, n_samples=len(non_threat_data), random_state=42)
@@ -29,14 +83,431 @@ def balance_dataset(data):
     return balanced_data
 
 
-def detect_threat_from_voice(input_text, threat_sentences, model, threshold=0.7):
-    input_embedding = model.encode([input_text], show_progress_bar=False)
-    similarities = cosine_similarity(input_embedding, threat_sentences)
-    is_threat = max(similarities[0]) > threshold
+def load_model(model_name=MODEL_NAME):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def unique_threat_sentences(data):
+    threats = data[data['labels'] == 'yes']['sentences']
+    return list(dict.fromkeys(sentence for sentence in threats if sentence.strip()))
+
+
+def encode_normalized(model, sentences, batch_size=64):
+    embeddings = model.encode(sentences, batch_size=batch_size, show_progress_bar=False,
+                              convert_to_numpy=True, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def replace_atomically(path, write, mode="wb", **open_kwargs):
+    """Calls `write(f)` on a temp file unique to this process and call, then moves it over `path`."""
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_threat_index(data, model, model_name, dataset_digest, index_dir=THREAT_INDEX_DIR):
+    sentences = unique_threat_sentences(data)
+    embeddings = encode_normalized(model, sentences)
+    os.makedirs(index_dir, exist_ok=True)
+    embeddings_path = os.path.join(index_dir, "embeddings.npy")
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    replace_atomically(embeddings_path, lambda f: np.save(f, embeddings))
+    manifest = {
+        "dataset_sha256": dataset_digest,
+        "model_name": model_name,
+        "count": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "sentences": sentences,
+    }
+    replace_atomically(manifest_path, lambda f: json.dump(manifest, f, ensure_ascii=False), "w", encoding="utf-8")
+    return np.load(embeddings_path, mmap_mode="r"), sentences
+
+
+def load_threat_index(model_name, dataset_digest, index_dir=THREAT_INDEX_DIR):
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if (manifest.get("dataset_sha256") != dataset_digest or manifest.get("model_name") != model_name
+            or embeddings.shape != (manifest.get("count"), manifest.get("dim"))):
+        return None
+    return embeddings, manifest["sentences"]
+
+
+def get_threat_index(dataset_path, model, model_name=MODEL_NAME, index_dir=THREAT_INDEX_DIR):
+    if not os.path.exists(dataset_path):
+        raise FileNotFoundError(f"Dataset file not found: {dataset_path}")
+    dataset_digest = file_sha256(dataset_path)
+    index = load_threat_index(model_name, dataset_digest, index_dir)
+    if index is not None:
+        return index
+    data = load_and_clean_dataset(dataset_path)
+    return build_threat_index(data, model, model_name, dataset_digest, index_dir)
+
+
+def detect_threat_from_voice(input_text, threat_embeddings, model, threshold=0.7):
+    input_embedding = encode_normalized(model, [input_text])[0]
+    is_threat = float(np.max(threat_embeddings @ input_embedding)) > threshold
     return 'Yes' if is_threat else 'No'
 
 
+def quantize_embeddings(embeddings, quantization):
+    """Returns (codes, scales), converting `QUANTIZED_BLOCK_ROWS` rows at a time. int8 keeps one float32
+    scale per vector; float16 needs none."""
+    if quantization not in QUANTIZATIONS[1:]:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATIONS[1:])}")
+    count = embeddings.shape[0]
+    codes = np.empty(embeddings.shape, dtype=np.float16 if quantization == "float16" else np.int8)
+    scales = np.empty(count, dtype=np.float32) if quantization == "int8" else None
+    for start in range(0, count, QUANTIZED_BLOCK_ROWS):
+        block = np.asarray(embeddings[start:start + QUANTIZED_BLOCK_ROWS], dtype=np.float32)
+        stop = start + len(block)
+        if scales is None:
+            codes[start:stop] = block
+            continue
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        codes[start:stop] = np.clip(np.rint(block / block_scales[:, None]), -127, 127)
+        scales[start:stop] = block_scales
+    return codes, scales
+
+
+def load_quantized_index(index_dir, embeddings, quantization):
+    """
+    Memory-maps the quantised codes (and int8 scales) stored next to `embeddings.npy`, building them
+    first when they are missing or were made for another dataset or model (see `manifest.json`).
+    """
+    with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    source = {key: manifest.get(key) for key in ("dataset_sha256", "model_name", "count", "dim")}
+    codes_path = os.path.join(index_dir, f"embeddings.{quantization}.npy")
+    scales_path = os.path.join(index_dir, f"scales.{quantization}.npy")
+    stamp_path = os.path.join(index_dir, f"quantized.{quantization}.json")
+    try:
+        with open(stamp_path, encoding="utf-8") as f:
+            current = json.load(f) == source
+    except (OSError, ValueError):
+        current = False
+    if not current:
+        codes, scales = quantize_embeddings(embeddings, quantization)
+        for path, array in ((codes_path, codes), (scales_path, scales)):
+            if array is not None:
+                replace_atomically(path, lambda f, array=array: np.save(f, array))
+        # Written last: the stamp only matches once both arrays are in place.
+        replace_atomically(stamp_path, lambda f: json.dump(source, f), "w", encoding="utf-8")
+    codes = np.load(codes_path, mmap_mode="r")
+    scales = np.load(scales_path, mmap_mode="r") if quantization == "int8" else None
+    if codes.shape != embeddings.shape or (scales is not None and scales.shape != (embeddings.shape[0],)):
+        raise ValueError(f"Quantised index in {index_dir} does not match embeddings.npy")
+    return codes, scales
+
+
+def _top_candidates(scores, width):
+    """Column indices of the `width` highest scores in each row, unordered."""
+    if width >= scores.shape[1]:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    return np.argpartition(-scores, width - 1, axis=1)[:, :width]
+
+
+class ThreatIndex:
+    """
+    Threat sentences and their embeddings, searchable for the closest references.
+    With `quantization` set to float16 or int8, scoring runs on the quantised matrix and only the
+    best `rerank` candidates per query are re-scored against float32 rows read from the index file.
+    """
+
+    def __init__(self, embeddings, sentences, quantization=THREAT_QUANTIZATION, rerank=THREAT_RERANK_CANDIDATES,
+                 index_dir=None):
+        self.embeddings = embeddings
+        self.sentences = sentences
+        self.quantization = quantization
+        self.rerank = rerank
+        self.codes = self.scales = None
+        self.rows_path = None
+        if quantization != "none":
+            if index_dir is None:
+                self.codes, self.scales = quantize_embeddings(embeddings, quantization)
+            else:
+                self.codes, self.scales = load_quantized_index(index_dir, embeddings, quantization)
+            if isinstance(embeddings, np.memmap) and embeddings.dtype == np.float32 and embeddings.flags.c_contiguous:
+                # Re-rank rows are read with pread, so the float32 file is never mapped into this process.
+                self.rows_path = embeddings.filename
+                self.rows_offset = embeddings.offset
+                self.row_bytes = embeddings.shape[1] * 4
+
+    def float_rows(self, rows):
+        if self.rows_path is None:
+            return np.asarray(self.embeddings[rows], dtype=np.float32)
+        # Opened per call, so an index never holds a file descriptor between searches.
+        with open(self.rows_path, "rb", buffering=0) as f:
+            data = b"".join(os.pread(f.fileno(), self.row_bytes, self.rows_offset + row * self.row_bytes)
+                            for row in rows.tolist())
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), -1)
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def scan_bytes(self):
+        """Size of the matrix that every query scans in full (the float32 rows are read only for re-ranking)."""
+        if self.codes is None:
+            return int(self.embeddings.nbytes)
+        return int(self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes))
+
+    def approximate_scores(self, queries):
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), QUANTIZED_BLOCK_ROWS):
+            block = slice(start, start + QUANTIZED_BLOCK_ROWS)
+            scores[:, block] = queries @ self.codes[block].astype(np.float32).T
+            if self.scales is not None:
+                scores[:, block] *= self.scales[block]
+        return scores
+
+    def search(self, queries, k=THREAT_TOP_K):
+        """Returns (best score per query, indices of the top k references, their scores), best first."""
+        queries = np.asarray(queries, dtype=np.float32)
+        k = max(1, min(k, len(self)))
+        if self.codes is None:
+            scores = queries @ self.embeddings.T
+            candidates = _top_candidates(scores, k)
+            exact = np.take_along_axis(scores, candidates, axis=1)
+        else:
+            candidates = _top_candidates(self.approximate_scores(queries), max(k, self.rerank))
+            unique = np.unique(candidates)
+            exact = queries @ self.float_rows(unique).T
+            exact = np.take_along_axis(exact, np.searchsorted(unique, candidates), axis=1)
+        order = np.argsort(-exact, axis=1)[:, :k]
+        top_indices = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(exact, order, axis=1)
+        return top_scores[:, 0], top_indices, top_scores
+
+    def matches(self, indices, scores):
+        return [{"sentence": self.sentences[i], "score": score} for i, score in zip(indices.tolist(), scores.tolist())]
+
+
+def normalize_text(text):
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """Bounded LRU of normalised text -> embedding."""
+
+    def __init__(self, max_size=THREAT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = embedding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class EmbeddingBatcher(threading.Thread):
+    """
+    Collects texts from concurrent callers for up to `max_wait_ms` (or until `max_batch_size`)
+    and encodes them with one `model.encode` call.
+    """
+
+    def __init__(self, model, max_batch_size=THREAT_BATCH_MAX_SIZE, max_wait_ms=THREAT_BATCH_MAX_WAIT_MS):
+        super().__init__(daemon=True)
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.batched_items = 0
+
+    def submit(self, text):
+        future = Future()
+        self.pending.put((text, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self._collect()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                with metrics.stage("encode"):
+                    embeddings = encode_normalized(self.model, texts, batch_size=len(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            by_text = dict(zip(texts, embeddings))
+            for text, future in batch:
+                future.set_result(by_text[text])
+            with self.lock:
+                self.batches += 1
+                self.batched_items += len(batch)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "items": self.batched_items,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "mean_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+                "fill_rate": self.batched_items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+            }
+
+
+class ThreatScoringService:
+    def __init__(self, model, threat_index, threshold=THREAT_THRESHOLD, top_k=THREAT_TOP_K,
+                 max_batch_size=THREAT_BATCH_MAX_SIZE, max_wait_ms=THREAT_BATCH_MAX_WAIT_MS,
+                 cache_size=THREAT_CACHE_SIZE):
+        self.threat_index = threat_index
+        self.threshold = threshold
+        self.top_k = top_k
+        self.cache = EmbeddingCache(cache_size)
+        self.batcher = EmbeddingBatcher(model, max_batch_size, max_wait_ms)
+        self.batcher.start()
+
+    def embed(self, text):
+        key = normalize_text(text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.batcher.submit(key).result()
+            self.cache.put(key, embedding)
+        return embedding
+
+    def embed_many(self, texts):
+        """Embeds several texts at once: cache misses are all queued before waiting, so they share batches."""
+        keys = [normalize_text(text) for text in texts]
+        cached = [self.cache.get(key) for key in keys]
+        futures = {key: self.batcher.submit(key) for key, embedding in zip(keys, cached) if embedding is None}
+        encoded = {key: future.result() for key, future in futures.items()}
+        for key, embedding in encoded.items():
+            self.cache.put(key, embedding)
+        return [embedding if embedding is not None else encoded[key] for key, embedding in zip(keys, cached)]
+
+    def _verdicts(self, embeddings, threshold, top_k):
+        with metrics.stage("similarity"):
+            best, indices, scores = self.threat_index.search(embeddings, self.top_k if top_k is None else top_k)
+        threshold = self.threshold if threshold is None else threshold
+        return [{"threat_detected": 'Yes' if score > threshold else 'No', "score": score, "threshold": threshold,
+                 "matches": self.threat_index.matches(row_indices, row_scores)}
+                for score, row_indices, row_scores in zip(best.tolist(), indices, scores)]
+
+    def detect_many(self, texts, threshold=None, top_k=None):
+        if not texts:
+            return []
+        return self._verdicts(np.stack(self.embed_many(texts)), threshold, top_k)
+
+    def detect(self, text, threshold=None, top_k=None):
+        return self._verdicts(self.embed(text)[None, :], threshold, top_k)[0]
+
+    def stats(self):
+        return {"batcher": self.batcher.stats(), "cache": self.cache.stats(),
+                "index": {"size": len(self.threat_index), "quantization": self.threat_index.quantization,
+                          "scan_bytes": self.threat_index.scan_bytes()}}
+
+
+_threat_service = None
+_threat_service_lock = threading.Lock()
+
+
+def get_threat_service():
+    global _threat_service
+    if _threat_service is None:
+        with _threat_service_lock:
+            if _threat_service is None:
+                model = load_model()
+                threat_embeddings, threat_sentences = get_threat_index(DATASET_PATH, model)
+                _threat_service = ThreatScoringService(
+                    model, ThreatIndex(threat_embeddings, threat_sentences, index_dir=THREAT_INDEX_DIR))
+    return _threat_service
+
+
+@app.route('/detect_threat', methods=['POST'])
+def detect_threat_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+        return jsonify({"error": "Text field is required"}), 400
+
+    threshold = data.get('threshold')
+    if threshold is not None and not isinstance(threshold, (int, float)):
+        return jsonify({"error": "Threshold must be a number"}), 400
+
+    top_k = data.get('top_k')
+    if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= THREAT_MAX_TOP_K):
+        return jsonify({"error": f"top_k must be an integer from 1 to {THREAT_MAX_TOP_K}"}), 400
+
+    result = get_threat_service().detect(data['text'], threshold, top_k)
+    result["message"] = "Threat detection completed successfully."
+    return jsonify(result)
+
+
+@app.route('/threat_stats', methods=['GET'])
+def threat_stats_api():
+    if _threat_service is None:
+        return jsonify({"error": "Threat scoring service is not loaded"}), 503
+    return jsonify(_threat_service.stats())
+
+
 def get_voice_input():
+    import speech_recognition as sr
+
     recognizer = sr.Recognizer()
     with sr.Microphone() as source:
         try:
@@ -48,13 +519,13 @@ def get_voice_input():
             return None
 
 
-def test_single_sentence_with_voice(threat_sentences, model, threshold=0.85):
+def test_single_sentence_with_voice(threat_embeddings, model, threshold=0.85):
     input_text = get_voice_input()
     if not input_text:
         print("Couldn't process your input. Please try again.")
         return
     print(f"Input Sentence: {input_text}")
-    threat_status = detect_threat_from_voice(input_text, threat_sentences, model, threshold)
+    threat_status = detect_threat_from_voice(input_text, threat_embeddings, model, threshold)
     print(f"Threat Detected: {threat_status}")
 
 
@@ -67,16 +538,588 @@ def test_single_sentence_with_voice(threat_sentences, model, threshold=0.85):
         else:
             print("Invalid response. Proceeding with default settings.")
 
-if __name__ == "__main__":
-    dataset_path = "C:\\Users\\Isha\\Downloads\\SafeGamingAPI-main\\SafeGamingAPI-main\\mainxlsx.xlsx"  # Provide the actual path to your dataset file
-    
+
+Utterance = namedtuple("Utterance", ["source", "index", "start_seconds", "end_seconds", "sample_rate", "pcm"])
+
+
+def _to_mono(samples, channels):
+    if channels == 1:
+        return samples
+    return samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+
+def iter_pcm_frames(stream, sample_rate, channels=1, frame_ms=VAD_FRAME_MS):
+    frame_bytes = int(sample_rate * frame_ms / 1000) * channels * 2
+    pending = b""
+    while True:
+        chunk = stream.read(frame_bytes - len(pending))
+        if not chunk:
+            break
+        pending += chunk
+        if len(pending) < frame_bytes:
+            continue
+        yield _to_mono(np.frombuffer(pending, dtype="<i2"), channels)
+        pending = b""
+    usable = len(pending) - len(pending) % (channels * 2)
+    if usable:
+        yield _to_mono(np.frombuffer(pending[:usable], dtype="<i2"), channels)
+
+
+def iter_wav_frames(file_path, frame_ms=VAD_FRAME_MS):
+    with wave.open(file_path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit PCM WAV files are supported: {file_path}")
+        frames_per_chunk = int(wav.getframerate() * frame_ms / 1000)
+        channels = wav.getnchannels()
+        while True:
+            data = wav.readframes(frames_per_chunk)
+            if not data:
+                break
+            yield _to_mono(np.frombuffer(data, dtype="<i2"), channels)
+
+
+def wav_sample_rate(file_path):
+    with wave.open(file_path, "rb") as wav:
+        return wav.getframerate()
+
+
+class EnergyVAD:
+    """Splits 16-bit mono frames into utterances wherever RMS energy stays above `threshold_db` (dBFS)."""
+
+    def __init__(self, threshold_db=-40.0, min_speech_ms=250, max_silence_ms=500, max_utterance_ms=15000):
+        self.threshold_db = threshold_db
+        self.min_speech_ms = min_speech_ms
+        self.max_silence_ms = max_silence_ms
+        self.max_utterance_ms = max_utterance_ms
+
+    @staticmethod
+    def frame_db(frame):
+        if not len(frame):
+            return -np.inf
+        rms = np.sqrt(np.mean(np.square(frame, dtype=np.float64))) / 32768.0
+        return 20.0 * np.log10(rms + 1e-10)
+
+    def segment(self, frames, sample_rate, source=""):
+        voiced = []
+        voiced_samples = 0
+        trailing_silence = 0
+        trailing_silence_samples = 0
+        position = 0
+        start = 0
+        index = 0
+
+        def emit():
+            kept = voiced[:len(voiced) - trailing_silence] if trailing_silence else voiced
+            samples = sum(len(f) for f in kept)
+            if samples * 1000 < self.min_speech_ms * sample_rate:
+                return None
+            return Utterance(source, index, start / sample_rate, (start + samples) / sample_rate,
+                             sample_rate, np.concatenate(kept).tobytes())
+
+        for frame in frames:
+            is_speech = self.frame_db(frame) > self.threshold_db
+            if voiced or is_speech:
+                if not voiced:
+                    start = position
+                voiced.append(frame)
+                voiced_samples += len(frame)
+                if is_speech:
+                    trailing_silence = trailing_silence_samples = 0
+                else:
+                    trailing_silence += 1
+                    trailing_silence_samples += len(frame)
+                if (trailing_silence_samples * 1000 >= self.max_silence_ms * sample_rate
+                        or voiced_samples * 1000 >= self.max_utterance_ms * sample_rate):
+                    utterance = emit()
+                    if utterance is not None:
+                        yield utterance
+                        index += 1
+                    voiced, voiced_samples, trailing_silence, trailing_silence_samples = [], 0, 0, 0
+            position += len(frame)
+        if voiced:
+            utterance = emit()
+            if utterance is not None:
+                yield utterance
+
+
+class RecognitionError(Exception):
+    """The recogniser could not be reached or failed for one utterance; the pipeline keeps going."""
+
+
+class SpeechRecognizer(ABC):
+    """Recogniser interface: `transcribe(utterance)` returns text or None, or raises RecognitionError."""
+
+    @abstractmethod
+    def transcribe(self, utterance):
+        pass
+
+
+class GoogleSpeechRecognizer(SpeechRecognizer):
+    def __init__(self, language='en-IN'):
+        import speech_recognition
+
+        self.sr = speech_recognition
+        self.language = language
+        self.recognizer = speech_recognition.Recognizer()
+
+    def transcribe(self, utterance):
+        audio = self.sr.AudioData(utterance.pcm, utterance.sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except self.sr.UnknownValueError:
+            return None
+        except self.sr.RequestError as e:
+            raise RecognitionError(f"Speech recognition request failed: {e}") from e
+
+
+class SidecarTranscriptRecognizer(SpeechRecognizer):
+    """Offline stand-in: reads line N of `<source>.txt` as the transcript of utterance N."""
+
+    def __init__(self):
+        self.transcripts = {}
+        self.lock = threading.Lock()
+
+    def transcribe(self, utterance):
+        with self.lock:
+            lines = self.transcripts.get(utterance.source)
+            if lines is None:
+                try:
+                    with open(f"{utterance.source}.txt", encoding="utf-8") as f:
+                        lines = [line.strip() for line in f]
+                except OSError:
+                    lines = []
+                self.transcripts[utterance.source] = lines
+        return lines[utterance.index] if utterance.index < len(lines) and lines[utterance.index] else None
+
+
+RECOGNIZERS = {"google": GoogleSpeechRecognizer, "sidecar": SidecarTranscriptRecognizer}
+
+_STAGE_DONE = object()
+
+
+def _get_unless_stopped(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _STAGE_DONE
+
+
+def _put_unless_stopped(target, item, stop):
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_voice_pipeline(sources, recognizer, score, vad=None, recognizer_workers=2,
+                       queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Yields one result dict per recognised utterance. `sources` holds WAV paths or
+    (name, binary stream, sample_rate, channels) tuples for raw PCM; `score` maps text to a dict.
+    Chunking, recognition and scoring run in their own threads joined by bounded queues.
+    """
+    vad = vad or EnergyVAD()
+    utterances = queue.Queue(maxsize=queue_size)
+    transcripts = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def chunk_stage():
+        try:
+            for source in sources:
+                if isinstance(source, str):
+                    frames = iter_wav_frames(source)
+                    name, sample_rate = source, wav_sample_rate(source)
+                else:
+                    name, stream, sample_rate, channels = source
+                    frames = iter_pcm_frames(stream, sample_rate, channels)
+                for utterance in vad.segment(frames, sample_rate, name):
+                    if not _put_unless_stopped(utterances, utterance, stop):
+                        return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(recognizer_workers):
+                _put_unless_stopped(utterances, _STAGE_DONE, stop)
+
+    def recognize_stage():
+        try:
+            while True:
+                utterance = _get_unless_stopped(utterances, stop)
+                if utterance is _STAGE_DONE:
+                    break
+                started = time.perf_counter()
+                try:
+                    text, error = recognizer.transcribe(utterance), None
+                except RecognitionError as e:
+                    text, error = None, str(e)
+                if (text or error) and not _put_unless_stopped(
+                        transcripts, (utterance, text, error, time.perf_counter() - started), stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put_unless_stopped(transcripts, _STAGE_DONE, stop)
+
+    def score_stage():
+        finished = 0
+        try:
+            while finished < recognizer_workers:
+                item = _get_unless_stopped(transcripts, stop)
+                if item is _STAGE_DONE:
+                    if stop.is_set():
+                        break
+                    finished += 1
+                    continue
+                utterance, text, error, recognize_seconds = item
+                started = time.perf_counter()
+                result = {
+                    "source": utterance.source,
+                    "utterance": utterance.index,
+                    "start_seconds": round(utterance.start_seconds, 3),
+                    "end_seconds": round(utterance.end_seconds, 3),
+                    "text": text,
+                    "recognize_seconds": recognize_seconds,
+                }
+                if error is None:
+                    result.update(score(text))
+                else:
+                    result.update({"threat_detected": None, "error": error})
+                result["score_seconds"] = time.perf_counter() - started
+                if not _put_unless_stopped(results, result, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put_unless_stopped(results, _STAGE_DONE, stop)
+
+    stages = [threading.Thread(target=chunk_stage, daemon=True)]
+    stages += [threading.Thread(target=recognize_stage, daemon=True) for _ in range(recognizer_workers)]
+    stages.append(threading.Thread(target=score_stage, daemon=True))
+    for stage in stages:
+        stage.start()
+    try:
+        while True:
+            try:
+                result = results.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            if result is _STAGE_DONE:
+                break
+            yield result
+    finally:
+        stop.set()
+    if errors:
+        raise errors[0]
+
+
+def scan_main(argv):
+    parser = argparse.ArgumentParser(prog="Voice_Threat_Detection.py scan",
+                                     description="Threat detection over recorded voice-chat WAV files.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--recognizer", choices=sorted(RECOGNIZERS), default="google")
+    parser.add_argument("--recognizer-workers", type=int, default=2)
+    parser.add_argument("--threshold-db", type=float, default=-40.0)
+    args = parser.parse_args(argv)
+
+    service = get_threat_service()
+    for result in run_voice_pipeline(args.files, RECOGNIZERS[args.recognizer](), service.detect,
+                                     EnergyVAD(args.threshold_db), args.recognizer_workers):
+        print(json.dumps(result, ensure_ascii=False))
+
+
+def iter_labelled_rows(file_path):
+    if file_path.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip().lower() for cell in next(rows)]
+            sentence_col, label_col = header.index('sentences'), header.index('labels')
+            for row in rows:
+                yield row[sentence_col], row[label_col]
+        finally:
+            workbook.close()
+    else:
+        with open(file_path, encoding="utf-8", newline="") as f:
+            for line in f:
+                sentence, _, label = line.rstrip("\r\n").rpartition("\t")
+                yield sentence, label
+
+
+def iter_labelled_chunks(file_path, chunk_size):
+    sentences, labels, skipped = [], [], 0
+    for sentence, label in iter_labelled_rows(file_path):
+        label = str(label).strip().lower() if label is not None else ""
+        if label not in ("yes", "no"):
+            skipped += 1
+            continue
+        sentences.append("" if sentence is None else str(sentence))
+        labels.append(label == "yes")
+        if len(sentences) >= chunk_size:
+            yield sentences, np.array(labels), skipped
+            sentences, labels, skipped = [], [], 0
+    if sentences or skipped:
+        yield sentences, np.array(labels, dtype=bool), skipped
+
+
+def threshold_metrics(counts, thresholds):
+    metrics = []
+    for threshold, (tp, fp, tn, fn) in zip(thresholds, counts.tolist()):
+        total = tp + fp + tn + fn
+        metrics.append({
+            "threshold": threshold,
+            "accuracy": (tp + tn) / total if total else 0.0,
+            "precision": tp / (tp + fp) if tp + fp else 0.0,
+            "recall": tp / (tp + fn) if tp + fn else 0.0,
+            "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        })
+    return metrics
+
+
+def evaluate_corpora(file_paths, threat_embeddings, model, thresholds=EVALUATION_THRESHOLDS,
+                     chunk_size=2048, batch_size=256, out_dir="evaluation"):
+    thresholds = np.asarray(sorted(thresholds), dtype=np.float32)
+    threshold_values = [round(float(t), 4) for t in thresholds]
+    counts = np.zeros((len(thresholds), 4), dtype=np.int64)
+    processed = skipped = 0
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(out_dir, "misclassified.csv"), "w", encoding="utf-8", newline="") as misclassified_file, \
+            open(os.path.join(out_dir, "metrics.jsonl"), "w", encoding="utf-8") as metrics_file:
+        writer = csv.writer(misclassified_file)
+        writer.writerow(["source", "sentence", "label", "score", "misclassified_at_thresholds"])
+        for file_path in file_paths:
+            for sentences, labels, chunk_skipped in iter_labelled_chunks(file_path, chunk_size):
+                skipped += chunk_skipped
+                if not sentences:
+                    continue
+                embeddings = encode_normalized(model, sentences, batch_size=batch_size)
+                scores = (embeddings @ threat_embeddings.T).max(axis=1)
+                predicted = scores[:, None] > thresholds[None, :]
+                actual = labels[:, None]
+                counts[:, 0] += (predicted & actual).sum(axis=0)
+                counts[:, 1] += (predicted & ~actual).sum(axis=0)
+                counts[:, 2] += (~predicted & ~actual).sum(axis=0)
+                counts[:, 3] += (~predicted & actual).sum(axis=0)
+                wrong = predicted != actual
+                for row in np.flatnonzero(wrong.any(axis=1)):
+                    writer.writerow([
+                        file_path, sentences[row], "yes" if labels[row] else "no", f"{scores[row]:.4f}",
+                        " ".join(f"{t:g}" for t, w in zip(threshold_values, wrong[row]) if w),
+                    ])
+                misclassified_file.flush()
+                processed += len(sentences)
+                elapsed = time.perf_counter() - start
+                metrics_file.write(json.dumps({
+                    "source": file_path,
+                    "processed": processed,
+                    "skipped": skipped,
+                    "sentences_per_second": processed / elapsed if elapsed else 0.0,
+                    "metrics": threshold_metrics(counts, threshold_values),
+                }) + "\n")
+                metrics_file.flush()
+    elapsed = time.perf_counter() - start
+    summary = {
+        "processed": processed,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "sentences_per_second": processed / elapsed if elapsed else 0.0,
+        "metrics": threshold_metrics(counts, threshold_values),
+    }
+    with open(os.path.join(out_dir, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def evaluate_main(argv):
+    parser = argparse.ArgumentParser(prog="Voice_Threat_Detection.py evaluate",
+                                     description="Bulk evaluation of the threat classifier.")
+    parser.add_argument("files", nargs="*", default=[DATASET_PATH, os.path.join(BASE_DIR, "hate_speech.tsv")])
+    parser.add_argument("--thresholds", default=",".join(str(t) for t in EVALUATION_THRESHOLDS))
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--out-dir", default="evaluation")
+    args = parser.parse_args(argv)
+
+    model = load_model()
+    threat_embeddings, _ = get_threat_index(DATASET_PATH, model)
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    summary = evaluate_corpora(args.files, threat_embeddings, model, thresholds,
+                               args.chunk_size, args.batch_size, args.out_dir)
+    print(f"Evaluated {summary['processed']} sentences ({summary['skipped']} skipped) "
+          f"at {summary['sentences_per_second']:.1f} sentences/second")
+    for m in summary["metrics"]:
+        print(f"threshold={m['threshold']:.2f} accuracy={m['accuracy']:.4f} "
+              f"precision={m['precision']:.4f} recall={m['recall']:.4f}")
+
+
+def _rss_mb(index_dir):
+    """
+    Resident anonymous memory of this process and resident pages mapped from files in `index_dir`,
+    in MB (Linux /proc), or None elsewhere.
+    """
+    index_dir = os.path.realpath(index_dir) + os.sep
+    anon = mapped = 0
+    in_index = False
     try:
-        data = load_and_clean_dataset(dataset_path)
-        balanced_data = balance_dataset(data)
-        threat_sentences = balanced_data[balanced_data['labels'] == 'yes']['sentences'].tolist()
+        with open("/proc/self/smaps", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if not parts[0].endswith(":"):
+                    # Mapping header: "start-end perms offset dev inode [path]".
+                    in_index = len(parts) >= 6 and parts[5].startswith(index_dir)
+                elif parts[0] == "Rss:" and in_index:
+                    mapped += int(parts[1])
+                elif parts[0] == "Anonymous:":
+                    anon += int(parts[1])
+    except OSError:
+        return None
+    return {"anon": anon / 1024.0, "index": mapped / 1024.0}
+
+
+def measure_index_memory(index_dir, quantization, queries_path, top_k, rerank, chunk_size=2048):
+    """
+    Run in a fresh process: growth of anonymous memory and of resident index-file pages after opening
+    the index, after one query (the pages a single request touches) and after searching every query.
+    """
+    queries = np.load(queries_path)
+    with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    before = _rss_mb(index_dir)
+    index = ThreatIndex(*load_threat_index(manifest["model_name"], manifest["dataset_sha256"], index_dir),
+                        quantization, rerank, index_dir)
+    loaded = _rss_mb(index_dir)
+    index.search(queries[:1], top_k)
+    first_query = _rss_mb(index_dir)
+    for start in range(0, len(queries), chunk_size):
+        index.search(queries[start:start + chunk_size], top_k)
+    searched = _rss_mb(index_dir)
+    if before is None:
+        return {}
+    return {f"rss_{kind}_{phase}_mb": round(after[kind] - before[kind], 3)
+            for phase, after in (("load", loaded), ("first_query", first_query), ("search", searched))
+            for kind in ("anon", "index")}
+
+
+def compare_quantization(file_path, model, threat_embeddings, threat_sentences, quantizations=("float16", "int8"),
+                         threshold=THREAT_THRESHOLD, top_k=THREAT_TOP_K, rerank=THREAT_RERANK_CANDIDATES,
+                         tolerance=QUANTIZATION_TOLERANCE, index_dir=THREAT_INDEX_DIR, chunk_size=2048, batch_size=256):
+    """
+    Scores a labelled corpus with the float32 index and each quantised one and compares them.
+    Memory is measured per index in a separate process, so pages mapped by one index do not count for another.
+    """
+    query_chunks, label_chunks = [], []
+    for sentences, labels, _ in iter_labelled_chunks(file_path, chunk_size):
+        if sentences:
+            query_chunks.append(encode_normalized(model, sentences, batch_size=batch_size))
+            label_chunks.append(labels)
+    queries = np.concatenate(query_chunks) if query_chunks else np.zeros((0, threat_embeddings.shape[1]), np.float32)
+    labels = np.concatenate(label_chunks) if label_chunks else np.zeros(0, dtype=bool)
+    processed = len(queries)
+
+    names = {"float32": "none", **{quantization: quantization for quantization in quantizations}}
+    indexes = {name: ThreatIndex(threat_embeddings, threat_sentences, quantization, rerank, index_dir)
+               for name, quantization in names.items()}
+    report = {"file": file_path, "processed": processed, "threshold": threshold, "top_k": top_k,
+              "rerank_candidates": rerank, "tolerance": tolerance, "indexes": {}}
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queries_path = os.path.join(tmp_dir, "queries.npy")
+        np.save(queries_path, queries)
+        for name, index in indexes.items():
+            started = time.perf_counter()
+            results = [index.search(queries[start:start + chunk_size], top_k)
+                       for start in range(0, processed, chunk_size)]
+            seconds = time.perf_counter() - started
+            best = np.concatenate([r[0] for r in results]) if results else np.zeros(0, np.float32)
+            indices = np.concatenate([r[1] for r in results]) if results else np.zeros((0, top_k), np.int64)
+            predicted = best > threshold
+            if reference is None:
+                reference = best, predicted, indices
+            counts = np.array([[(predicted & labels).sum(), (predicted & ~labels).sum(),
+                                (~predicted & ~labels).sum(), (~predicted & labels).sum()]])
+            row = threshold_metrics(counts, [threshold])[0]
+            row.update({
+                "scan_bytes": index.scan_bytes(),
+                "scan_bytes_saving": 1.0 - index.scan_bytes() / indexes["float32"].scan_bytes(),
+                "search_seconds": round(seconds, 4),
+                "decision_agreement": float((predicted == reference[1]).mean()) if processed else 1.0,
+                "max_score_error": float(np.abs(best - reference[0]).max()) if processed else 0.0,
+                "top_k_overlap": float(np.mean([len(set(a) & set(b)) / len(b) for a, b in
+                                                zip(indices.tolist(), reference[2].tolist())])) if processed else 1.0,
+            })
+            measured = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "quantization-measure", index_dir, names[name],
+                 queries_path, str(top_k), str(rerank)], capture_output=True, text=True, check=True)
+            row.update(json.loads(measured.stdout.strip().splitlines()[-1]))
+            row["accuracy_delta"] = row["accuracy"] - report["indexes"].get("float32", row)["accuracy"]
+            row["within_tolerance"] = abs(row["accuracy_delta"]) <= tolerance
+            report["indexes"][name] = row
+    return report
+
 
-        model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        threat_embeddings = model.encode(threat_sentences, batch_size=16, show_progress_bar=False)
+def quantization_main(argv):
+    parser = argparse.ArgumentParser(prog="Voice_Threat_Detection.py quantization",
+                                     description="Compare quantised threat indexes with the float32 one.")
+    parser.add_argument("file", nargs="?", default=DATASET_PATH)
+    parser.add_argument("--quantizations", default="float16,int8")
+    parser.add_argument("--threshold", type=float, default=THREAT_THRESHOLD)
+    parser.add_argument("--top-k", type=int, default=THREAT_TOP_K)
+    parser.add_argument("--rerank", type=int, default=THREAT_RERANK_CANDIDATES)
+    parser.add_argument("--tolerance", type=float, default=QUANTIZATION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    quantizations = [q.strip() for q in args.quantizations.split(",") if q.strip()]
+    unknown = [q for q in quantizations if q not in QUANTIZATIONS[1:]]
+    if unknown:
+        parser.error(f"unknown quantizations: {', '.join(unknown)}")
+    model = load_model()
+    threat_embeddings, threat_sentences = get_threat_index(DATASET_PATH, model)
+    report = compare_quantization(args.file, model, threat_embeddings, threat_sentences, quantizations,
+                                  args.threshold, args.top_k, args.rerank, args.tolerance)
+    print(json.dumps(report, indent=2))
+    return 0 if all(row["within_tolerance"] for row in report["indexes"].values()) else 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "quantization-measure":
+        index_dir, quantization, queries_path, top_k, rerank = sys.argv[2:7]
+        print(json.dumps(measure_index_memory(index_dir, quantization, queries_path, int(top_k), int(rerank))))
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "quantization":
+        sys.exit(quantization_main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "scan":
+        scan_main(sys.argv[2:])
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "evaluate":
+        evaluate_main(sys.argv[2:])
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        get_threat_service()
+        app.run(host="0.0.0.0", port=5000, threaded=True)
+        sys.exit(0)
+
+    try:
+        model = load_model()
+        threat_embeddings, threat_sentences = get_threat_index(DATASET_PATH, model)
 
         # Run the real-time voice threat detection
         print("Running real-time threat detection...")
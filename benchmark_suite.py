@@ -0,0 +1,521 @@
+"""
+Repeatable benchmark suite for every SafeGamingApi service.
+Each service's Flask app is driven twice per endpoint: sequentially through its test client, and
+by a concurrent load generator over HTTP against a local threaded server. Latency (p50/p95/p99),
+throughput, error counts and memory (tracemalloc peak per endpoint, process RSS high-water mark)
+are written as JSON with stable keys so two runs can be diffed or compared.
+The camera, PyAudio, speech recogniser, face encoder and sentence-embedding model are replaced by
+deterministic local stand-ins, chat traffic is built from `hate_speech.tsv` and
+`combined_words_file.csv`, and faces are synthetic images, so no hardware or network is needed.
+All state (caches, journals, indexes, databases) goes to a temporary directory.
+Run `python benchmark_suite.py [--services swear,crypto] [--out results.json]`, and
+`python benchmark_suite.py compare old.json new.json` to print the change per endpoint.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import contextlib
+import gc
+import hashlib
+import http.client
+import importlib
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_SEED = 1234
+FAKE_EMBEDDING_DIM = 384
+
+Scenario = namedtuple("Scenario", ["name", "method", "path", "build"])
+
+# Hardware and model stand-ins
+
+class FakeSentenceTransformer:
+    """Hashed bag-of-words embeddings: deterministic, CPU-cheap and sensitive to shared words."""
+
+    def __init__(self, model_name=None, dim=FAKE_EMBEDDING_DIM):
+        self.model_name = model_name
+        self.dim = dim
+
+    def _embed(self, sentence):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in str(sentence).lower().split():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vector
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        embeddings = np.stack([self._embed(s) for s in ([sentences] if single else sentences)]) \
+            if (single or len(sentences)) else np.zeros((0, self.dim), dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+        return embeddings[0] if single else embeddings
+
+class FakeUnknownValueError(Exception):
+    pass
+
+class FakeRequestError(Exception):
+    pass
+
+class FakeAudioData:
+    def __init__(self, frame_data, sample_rate, sample_width):
+        self.frame_data = frame_data
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+
+class FakeRecognizer:
+    """Returns a fixed phrase for audio with any energy, as the network recogniser would for speech."""
+
+    def listen(self, source, timeout=None, phrase_time_limit=None):
+        return FakeAudioData(b"\1\0" * 1600, 16000, 2)
+
+    def recognize_google(self, audio, language=None):
+        if not any(audio.frame_data):
+            raise FakeUnknownValueError()
+        return "i will find you after the match"
+
+class FakeMicrophone:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakePyAudio:
+    DEVICES = [{"name": "Built-in Microphone", "maxInputChannels": 1},
+               {"name": "Speakers", "maxInputChannels": 0}]
+
+    def get_device_count(self):
+        return len(self.DEVICES)
+
+    def get_device_info_by_index(self, index):
+        return self.DEVICES[index]
+
+    def terminate(self):
+        pass
+
+class FakeVideoCapture:
+    def __init__(self, index=0):
+        self.index = index
+
+    def isOpened(self):
+        return False
+
+    def release(self):
+        pass
+
+def fake_face_encodings(image):
+    """8x8 block means of two colour channels: the same synthetic person encodes to nearby vectors."""
+    import cv2
+
+    small = cv2.resize(image, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float64) / 255.0
+    return [small[:, :, :2].reshape(-1)]
+
+def fake_compare_faces(known_encodings, encoding, tolerance=0.6):
+    return [bool(np.linalg.norm(np.asarray(known) - encoding) <= tolerance) for known in known_encodings]
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+def install_fakes():
+    sys.modules["sentence_transformers"] = _module("sentence_transformers", SentenceTransformer=FakeSentenceTransformer)
+    sys.modules["speech_recognition"] = _module(
+        "speech_recognition", Recognizer=FakeRecognizer, AudioData=FakeAudioData,
+        Microphone=FakeMicrophone, UnknownValueError=FakeUnknownValueError,
+        RequestError=FakeRequestError)
+    sys.modules["pyaudio"] = _module("pyaudio", PyAudio=FakePyAudio)
+    sys.modules["face_recognition"] = _module("face_recognition", face_encodings=fake_face_encodings,
+                                              compare_faces=fake_compare_faces)
+    import cv2
+    cv2.VideoCapture = FakeVideoCapture
+
+def prepare_environment(work_dir):
+    """Points every service's state at `work_dir` before the modules are imported."""
+    game_dir = os.path.join(work_dir, "game")
+    make_game_tree(game_dir, random.Random(BENCH_SEED))
+    os.environ.update({
+        "SWEAR_CACHE_DIR": os.path.join(work_dir, "swear_cache"),
+        "SWEAR_WORDS_WATCH": "0",
+        "THREAT_MODEL": "benchmark-hashed-bow",
+        "THREAT_INDEX_DIR": os.path.join(work_dir, "threat_index"),
+        "REMINDER_JOURNAL": os.path.join(work_dir, "reminder_journal.jsonl"),
+        "GAME_FILES_DIR": game_dir,
+        "INTEGRITY_STATE_DIR": os.path.join(work_dir, "integrity"),
+        "FACE_INDEX_DIR": os.path.join(work_dir, "face_index"),
+        "APPROVAL_DB_PATH": os.path.join(work_dir, "approvals.db"),
+        "ACTIVE_ENCRYPTION_KEY": "",
+    })
+
+# Synthetic corpora
+
+def load_chat_corpus(file_path=os.path.join(BASE_DIR, "hate_speech.tsv")):
+    with open(file_path, encoding="utf-8") as f:
+        return [line.rstrip("\n").split("\t")[0] for line in f if line.strip()]
+
+def load_swear_list(file_path=os.path.join(BASE_DIR, "combined_words_file.csv")):
+    with open(file_path, encoding="utf-8") as f:
+        return [line.strip() for line in f.readlines()[1:] if line.strip()]
+
+def make_chat_messages(corpus, words, count, rng, swear_rate=0.3):
+    messages = []
+    for _ in range(count):
+        tokens = rng.choice(corpus).split()
+        if words and rng.random() < swear_rate:
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(words))
+        messages.append(" ".join(tokens))
+    return messages
+
+def make_face_images(people, rng, side=256):
+    """PNG (ID photo, selfie) pairs per synthetic person: a blocky colour pattern plus per-shot noise."""
+    import cv2
+
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    faces = []
+    for _ in range(people):
+        base = cv2.resize(np_rng.integers(0, 256, (8, 8, 3), dtype=np.uint8), (side, side),
+                          interpolation=cv2.INTER_NEAREST)
+        shots = []
+        for _ in range(2):
+            noisy = np.clip(base.astype(np.int16) + np_rng.integers(-8, 9, base.shape), 0, 255).astype(np.uint8)
+            shots.append(cv2.imencode(".png", noisy)[1].tobytes())
+        faces.append(tuple(shots))
+    return faces
+
+def make_game_tree(root, rng, directories=20, files_per_directory=25, file_bytes=16 * 1024):
+    for d in range(directories):
+        directory = os.path.join(root, f"assets{d:02d}")
+        os.makedirs(directory, exist_ok=True)
+        for f in range(files_per_directory):
+            with open(os.path.join(directory, f"file{f:03d}.bin"), "wb") as out:
+                out.write(rng.randbytes(file_bytes))
+    for name in ("game.exe", "config.ini"):
+        with open(os.path.join(root, name), "wb") as out:
+            out.write(rng.randbytes(file_bytes))
+
+# Scenarios per service
+
+def service_scenarios(service, module, rng):
+    corpus, words = load_chat_corpus(), load_swear_list()
+
+    def chat(count=1):
+        return make_chat_messages(corpus, words, count, rng)
+
+    if service == "swear":
+        return [
+            Scenario("filter_swear_words", "POST", "/filter_swear_words", lambda i: {"json": {"text": chat()[0]}}),
+            Scenario("filter_swear_words_batch_100", "POST", "/filter_swear_words/batch",
+                     lambda i: {"json": {"messages": chat(100)}}),
+            Scenario("filter_swear_words_stream_100", "POST", "/filter_swear_words/stream",
+                     lambda i: {"data": "".join(json.dumps({"text": m}) + "\n" for m in chat(100)),
+                                "content_type": "application/x-ndjson"}),
+        ]
+    if service == "threats":
+        return [
+            Scenario("detect_threat", "POST", "/detect_threat", lambda i: {"json": {"text": chat()[0]}}),
+            Scenario("threat_stats", "GET", "/threat_stats", lambda i: {}),
+        ]
+    if service == "moderation":
+        return [
+            Scenario("moderate", "POST", "/moderate", lambda i: {"json": {"text": chat()[0]}}),
+            Scenario("moderate_batch_100", "POST", "/moderate", lambda i: {"json": {"messages": chat(100)}}),
+        ]
+    if service == "gambling":
+        def game(i):
+            return {"game_id": i, "has_bet_or_wager": rng.random() < 0.5,
+                    "has_randomness": rng.random() < 0.5, "has_rewards": rng.random() < 0.5}
+        return [
+            Scenario("detect_gambling_game", "POST", "/detect_gambling_game", lambda i: {"json": {"metadata": game(i)}}),
+            Scenario("detect_gambling_game_batch_1000", "POST", "/detect_gambling_game/batch",
+                     lambda i: {"json": {"games": [game(j) for j in range(1000)]}}),
+        ]
+    if service == "crypto":
+        key = module.Fernet.generate_key().decode()
+        token = module.app.test_client().post("/encrypt", json={"data": "x" * 1024, "key": key}).get_json()
+        payload = rng.randbytes(1024 * 1024)
+        return [
+            Scenario("encrypt_json_1k", "POST", "/encrypt", lambda i: {"json": {"data": "x" * 1024, "key": key}}),
+            Scenario("decrypt_json_1k", "POST", "/decrypt", lambda i: {"json": token}),
+            Scenario("encrypt_stream_1m", "POST", "/encrypt",
+                     lambda i: {"data": payload, "content_type": "application/octet-stream",
+                                "headers": {"X-Encryption-Key": key}}),
+        ]
+    if service == "timer":
+        return [
+            Scenario("start_game_timer", "POST", "/start_game_timer",
+                     lambda i: {"json": {"user_id": f"bench{i % 1000}", "interval_seconds": 3600, "max_reminders": 3}}),
+            Scenario("get_session", "GET", "/sessions/bench1", lambda i: {}),
+            Scenario("get_reminders", "GET", "/get_reminders?user_id=bench1", lambda i: {}),
+        ]
+    if service == "resources":
+        return [
+            Scenario("status", "GET", "/status", lambda i: {}),
+            Scenario("history_aggregate", "GET", "/history?aggregate=1", lambda i: {}),
+        ]
+    if service == "integrity":
+        return [Scenario("status", "GET", "/status", lambda i: {})]
+    if service == "fraud":
+        faces = make_face_images(64, rng)
+        for i in range(64):
+            module.approval_store.approve(f"gift{i}", "👍🏻")
+
+        def verify(i):
+            id_photo, selfie = faces[i % len(faces)]
+            return {"data": {"receiver_id": f"receiver{i}", "id_photo": (_BytesFile(id_photo), "id.png"),
+                             "selfie": (_BytesFile(selfie), "selfie.png")}}
+        return [
+            Scenario("verify_blocking", "POST", "/verify", verify),
+            Scenario("send_gift", "POST", "/send_gift",
+                     lambda i: {"json": {"sender_id": "bench", "receiver_id": f"gift{i % 64}", "condition": "👍🏻"}}),
+        ]
+    return []
+
+class _BytesFile:
+    """Fresh readable file for each request body built from the same bytes."""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else self.offset + size
+        chunk = self.data[self.offset:end]
+        self.offset += len(chunk)
+        return chunk
+
+# Measurement
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1))))]
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "mean_ms": _ms(sum(latencies) / len(latencies)) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+    }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000.0, 3)
+
+def run_sequential(client, scenario, requests):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(requests):
+        kwargs = scenario.build(i)
+        t0 = time.perf_counter()
+        response = client.open(scenario.path, method=scenario.method, **kwargs)
+        response.get_data()
+        latencies.append(time.perf_counter() - t0)
+        errors += response.status_code >= 400
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+def build_http_request(scenario, i):
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(path=scenario.path, method=scenario.method, **scenario.build(i)).get_environ()
+    body = environ["wsgi.input"].read()
+    headers = {key[5:].replace("_", "-").title(): value for key, value in environ.items() if key.startswith("HTTP_")}
+    if environ.get("CONTENT_TYPE"):
+        headers["Content-Type"] = environ["CONTENT_TYPE"]
+    headers["Content-Length"] = str(len(body))
+    query = environ.get("QUERY_STRING")
+    return environ["PATH_INFO"] + (f"?{query}" if query else ""), body, headers
+
+def run_concurrent(port, scenario, requests, concurrency):
+    # Bodies are built up front so the load generator measures the server, not request construction.
+    prepared = [build_http_request(scenario, i) for i in range(requests)]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def send(item):
+        path, body, headers = item
+        t0 = time.perf_counter()
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        try:
+            connection.request(scenario.method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            failed = response.status >= 400
+        except OSError:
+            failed = True
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, prepared))
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+def measure_memory(client, scenario, requests):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for i in range(requests):
+            client.open(scenario.path, method=scenario.method, **scenario.build(i)).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"tracemalloc_peak_kb": round(peak / 1024.0, 1),
+            "rss_high_water_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)}
+
+def start_http_server(app):
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def benchmark_service(service, module_name, requests, concurrency, warmup, memory_requests):
+    rng = random.Random(BENCH_SEED)
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_seconds = time.perf_counter() - started
+    client = module.app.test_client()
+    server = start_http_server(module.app)
+    results = {}
+    try:
+        for scenario in service_scenarios(service, module, rng):
+            for i in range(warmup):
+                client.open(scenario.path, method=scenario.method, **scenario.build(i)).get_data()
+            result = {"method": scenario.method, "path": scenario.path}
+            result["test_client"] = run_sequential(client, scenario, requests)
+            # Memory is traced before the HTTP run so that run's thread teardown does not land in the peak.
+            result["memory"] = measure_memory(client, scenario, memory_requests)
+            result["http_concurrent"] = run_concurrent(server.server_port, scenario, requests, concurrency)
+            results[scenario.name] = result
+    finally:
+        server.shutdown()
+    return {"module": module_name, "import_seconds": round(import_seconds, 4), "endpoints": results}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(services, requests=200, concurrency=8, warmup=5, memory_requests=50, work_dir=None):
+    from gateway import SERVICES
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="safegaming-bench-")
+    prepare_environment(work_dir)
+    install_fakes()
+    sys.path.insert(0, BASE_DIR)
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": BENCH_SEED,
+            "requests": requests,
+            "concurrency": concurrency,
+            "warmup": warmup,
+        },
+        "services": {},
+    }
+    for service in services:
+        _, module_name, _ = SERVICES[service]
+        try:
+            report["services"][service] = benchmark_service(service, module_name, requests, concurrency,
+                                                            warmup, memory_requests)
+        except Exception as e:
+            report["services"][service] = {"module": module_name, "error": f"{type(e).__name__}: {e}"}
+        print(f"{service}: done", file=sys.stderr)
+    if own_dir:
+        report["meta"]["work_dir"] = work_dir
+    return report
+
+def compare_reports(old, new):
+    """Yields (service, endpoint, mode, metric, old, new, ratio) for every latency/throughput metric in both."""
+    for service, new_service in sorted(new["services"].items()):
+        old_endpoints = old["services"].get(service, {}).get("endpoints", {})
+        for endpoint, new_result in sorted(new_service.get("endpoints", {}).items()):
+            old_result = old_endpoints.get(endpoint)
+            if old_result is None:
+                continue
+            for mode in ("test_client", "http_concurrent"):
+                for metric in ("p50_ms", "p99_ms", "throughput_rps"):
+                    before, after = old_result[mode][metric], new_result[mode][metric]
+                    ratio = round(after / before, 3) if before and after is not None else None
+                    yield service, endpoint, mode, metric, before, after, ratio
+
+def main(argv=None):
+    from gateway import SERVICES
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="benchmark_suite.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        args = parser.parse_args(argv[1:])
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        for row in compare_reports(old, new):
+            print("\t".join("" if value is None else str(value) for value in row))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark every SafeGamingApi endpoint with local stand-ins.")
+    parser.add_argument("--services", default="all", help="'all' or a comma-separated list of gateway service names")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-requests", type=int, default=50)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    services = list(SERVICES) if args.services == "all" else [s.strip() for s in args.services.split(",") if s.strip()]
+    unknown = [s for s in services if s not in SERVICES]
+    if unknown:
+        parser.error(f"unknown services: {', '.join(unknown)}")
+    # Services print to stdout (e.g. gift notices); keep stdout for the report alone.
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_suite(services, args.requests, args.concurrency, args.warmup, args.memory_requests)
+    output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__mp_main__":
+    # Verification pool workers start fresh (forkserver/spawn) and re-import this module under this name.
+    install_fakes()
+
+if __name__ == "__main__":
+    main()
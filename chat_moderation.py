@@ -0,0 +1,273 @@
+"""
+Flask API for cascaded chat moderation.
+Every message first goes through the lexical swear matcher; only messages that trip one of the
+configured pre-filters (`MODERATION_PREFILTERS`) are escalated to semantic threat scoring, so the
+rest never touch the embedding model. The response combines both verdicts.
+Pre-filters: `swear` (the message contains a swear word), `keywords` (it contains a threat keyword,
+from `MODERATION_KEYWORDS_FILE` or derived from the threat dataset) and `all` (escalate everything).
+Endpoints: /moderate (POST, `text` or a `messages` array) and /moderation_stats (GET).
+Run `python chat_moderation.py replay [corpus]` to replay a labelled corpus (default `hate_speech.tsv`)
+through the cascade and through both stages on every message, and compare escalation and throughput.
+"""
+from flask import Flask, request, jsonify
+from collections import Counter
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+import HarshwordsEncryption as lexical
+import Voice_Threat_Detection as semantic
+from instrumentation import instrument_app
+
+app = Flask(__name__)
+metrics = instrument_app(app, "moderation")
+
+PREFILTER_NAMES = ("swear", "keywords", "all")
+MODERATION_PREFILTERS = [name.strip() for name in os.environ.get("MODERATION_PREFILTERS", "keywords").split(",")
+                         if name.strip()]
+MODERATION_KEYWORDS_FILE = os.environ.get("MODERATION_KEYWORDS_FILE")
+MODERATION_KEYWORDS_TOP = int(os.environ.get("MODERATION_KEYWORDS_TOP", "300"))
+MODERATION_KEYWORDS_MIN_COUNT = int(os.environ.get("MODERATION_KEYWORDS_MIN_COUNT", "3"))
+MODERATION_MAX_BATCH = int(os.environ.get("MODERATION_MAX_BATCH", "1000"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def derive_threat_keywords(dataset_path, top=MODERATION_KEYWORDS_TOP, min_count=MODERATION_KEYWORDS_MIN_COUNT):
+    """Tokens most over-represented in threat sentences, by smoothed log-odds of document frequency."""
+    threat_counts, other_counts = Counter(), Counter()
+    threats = others = 0
+    for sentence, label in semantic.iter_labelled_rows(dataset_path):
+        label = str(label).strip().lower() if label is not None else ""
+        if label not in ("yes", "no"):
+            continue
+        tokens = {token for token in _TOKEN_RE.findall(str(sentence or "").lower()) if len(token) > 2}
+        if label == "yes":
+            threat_counts.update(tokens)
+            threats += 1
+        else:
+            other_counts.update(tokens)
+            others += 1
+    scored = []
+    for token, count in threat_counts.items():
+        if count < min_count:
+            continue
+        log_odds = math.log((count + 1) / (threats + 2)) - math.log((other_counts[token] + 1) / (others + 2))
+        if log_odds > 0:
+            scored.append((log_odds, token))
+    return [token for _, token in sorted(scored, reverse=True)[:top]]
+
+def load_threat_keywords(file_path=MODERATION_KEYWORDS_FILE, dataset_path=semantic.DATASET_PATH):
+    if file_path:
+        with open(file_path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return derive_threat_keywords(dataset_path)
+
+_keyword_matcher = None
+_keyword_matcher_lock = threading.Lock()
+
+def get_keyword_matcher():
+    global _keyword_matcher
+    if _keyword_matcher is None:
+        with _keyword_matcher_lock:
+            if _keyword_matcher is None:
+                _keyword_matcher = lexical.SwearMatcher(load_threat_keywords())
+    return _keyword_matcher
+
+class ChatModerator:
+    """Lexical pass on every message, semantic scoring only for escalated ones; keeps traffic counters."""
+
+    def __init__(self, prefilters=MODERATION_PREFILTERS, threat_service=None, keyword_matcher=None):
+        unknown = [name for name in prefilters if name not in PREFILTER_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown moderation pre-filters: {', '.join(unknown)}")
+        self.prefilters = list(prefilters)
+        self.threat_service = threat_service
+        self.keyword_matcher = keyword_matcher
+        self.lock = threading.Lock()
+        self.init_lock = threading.Lock()
+        self.messages = 0
+        self.escalated = 0
+        self.prefilter_hits = Counter()
+
+    # Lazy dependencies load under their own lock, so a slow model load never blocks stats().
+    def _service(self):
+        if self.threat_service is None:
+            with self.init_lock:
+                if self.threat_service is None:
+                    self.threat_service = semantic.get_threat_service()
+        return self.threat_service
+
+    def _keywords(self):
+        if self.keyword_matcher is None:
+            with self.init_lock:
+                if self.keyword_matcher is None:
+                    self.keyword_matcher = get_keyword_matcher()
+        return self.keyword_matcher
+
+    def prefilter(self, text, swear_matches):
+        hits = []
+        if "all" in self.prefilters:
+            hits.append("all")
+        if "swear" in self.prefilters and swear_matches:
+            hits.append("swear")
+        if "keywords" in self.prefilters and next(iter(self._keywords().finditer(text)), None) is not None:
+            hits.append("keywords")
+        return hits
+
+    def moderate_many(self, texts, threshold=None, pattern=None):
+        pattern = pattern or lexical.swear_pattern
+        results, escalate = [], []
+        with metrics.stage("lexical"):
+            for text in texts:
+                filtered_text, matches = lexical.filter_swear_words_with_matches(text, pattern)
+                hits = self.prefilter(text, matches)
+                results.append({
+                    "filtered_text": filtered_text,
+                    "matches": matches,
+                    "escalated": bool(hits),
+                    "prefilter_hits": hits,
+                    "threat_detected": None,
+                    "threat_score": None,
+                    "threat_matches": [],
+                    "verdict": "profanity" if matches else "clean",
+                })
+                if hits:
+                    escalate.append(len(results) - 1)
+        if escalate:
+            with metrics.stage("semantic"):
+                verdicts = self._service().detect_many([texts[i] for i in escalate], threshold)
+            for i, verdict in zip(escalate, verdicts):
+                results[i]["threat_detected"] = verdict["threat_detected"]
+                results[i]["threat_score"] = verdict["score"]
+                results[i]["threat_matches"] = verdict["matches"]
+                if verdict["threat_detected"] == 'Yes':
+                    results[i]["verdict"] = "threat"
+        with self.lock:
+            self.messages += len(texts)
+            self.escalated += len(escalate)
+            for i in escalate:
+                self.prefilter_hits.update(results[i]["prefilter_hits"])
+        return results
+
+    def stats(self):
+        with self.lock:
+            return {
+                "prefilters": self.prefilters,
+                "messages": self.messages,
+                "escalated": self.escalated,
+                "escalation_fraction": self.escalated / self.messages if self.messages else 0.0,
+                "prefilter_hits": dict(self.prefilter_hits),
+            }
+
+moderator = ChatModerator()
+
+def warm_up():
+    lexical.start_watching()
+    if "keywords" in moderator.prefilters:
+        moderator._keywords()
+    moderator._service()
+
+@app.before_request
+def _ensure_swear_watching():
+    lexical.start_watching()
+
+@app.route('/moderate', methods=['POST'])
+def moderate_api():
+    if lexical.swear_pattern is None:
+        return jsonify({"error": "Swear words list is not loaded"}), 503
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or ('text' not in data and 'messages' not in data):
+        return jsonify({"error": "A 'text' string or a 'messages' array is required"}), 400
+
+    threshold = data.get('threshold')
+    if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))):
+        return jsonify({"error": "Threshold must be a number"}), 400
+
+    if 'messages' in data:
+        messages = data['messages']
+        if not isinstance(messages, list) or not all(isinstance(message, str) for message in messages):
+            return jsonify({"error": "Messages must be an array of strings"}), 400
+        if len(messages) > MODERATION_MAX_BATCH:
+            return jsonify({"error": f"Batch too large. At most {MODERATION_MAX_BATCH} messages per request."}), 413
+        return jsonify({"results": moderator.moderate_many(messages, threshold),
+                        "message": "Moderation completed successfully."})
+
+    if not isinstance(data['text'], str):
+        return jsonify({"error": "Text must be a string"}), 400
+    result = moderator.moderate_many([data['text']], threshold)[0]
+    result["message"] = "Moderation completed successfully."
+    return jsonify(result)
+
+@app.route('/moderation_stats', methods=['GET'])
+def moderation_stats_api():
+    return jsonify(moderator.stats())
+
+def replay(corpus_path, prefilters, model, threat_index, keyword_matcher, chunk_size=512):
+    """Runs a labelled corpus through a fresh moderator (own embedding cache) and returns its results."""
+    service = semantic.ThreatScoringService(model, threat_index)
+    moderator = ChatModerator(prefilters, service, keyword_matcher)
+    flagged, labels = [], []
+    started = time.perf_counter()
+    for sentences, chunk_labels, _ in semantic.iter_labelled_chunks(corpus_path, chunk_size):
+        for result in moderator.moderate_many(sentences):
+            flagged.append(result["threat_detected"] == 'Yes')
+        labels.extend(chunk_labels)
+    elapsed = time.perf_counter() - started
+    tp = sum(1 for f, label in zip(flagged, labels) if f and label)
+    fp = sum(1 for f, label in zip(flagged, labels) if f and not label)
+    fn = sum(1 for f, label in zip(flagged, labels) if not f and label)
+    summary = moderator.stats()
+    summary.update({
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(flagged) / elapsed, 1) if elapsed else None,
+        "threats_flagged": sum(flagged),
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+    })
+    return summary, flagged
+
+def replay_main(argv):
+    parser = argparse.ArgumentParser(prog="chat_moderation.py replay")
+    parser.add_argument("corpus", nargs="?", default=os.path.join(semantic.BASE_DIR, "hate_speech.tsv"))
+    parser.add_argument("--prefilters", default=",".join(MODERATION_PREFILTERS))
+    parser.add_argument("--stand-ins", action="store_true",
+                        help="use the benchmark suite's hashed embedding model instead of sentence-transformers")
+    args = parser.parse_args(argv)
+
+    model_name, index_dir = semantic.MODEL_NAME, semantic.THREAT_INDEX_DIR
+    if args.stand_ins:
+        import benchmark_suite
+        import tempfile
+        benchmark_suite.install_fakes()
+        model_name, index_dir = "benchmark-hashed-bow", tempfile.mkdtemp(prefix="moderation-replay-")
+    model = semantic.load_model(model_name)
+    threat_index = semantic.ThreatIndex(*semantic.get_threat_index(semantic.DATASET_PATH, model, model_name, index_dir),
+                                        index_dir=index_dir)
+    model.encode(["warm up"])
+    prefilters = [name.strip() for name in args.prefilters.split(",") if name.strip()]
+    keyword_matcher = get_keyword_matcher() if "keywords" in prefilters else None
+
+    cascade, cascade_flags = replay(args.corpus, prefilters, model, threat_index, keyword_matcher)
+    full, full_flags = replay(args.corpus, ["all"], model, threat_index, None)
+    full_hits = sum(full_flags)
+    kept = sum(1 for c, f in zip(cascade_flags, full_flags) if c and f)
+    print(json.dumps({
+        "corpus": args.corpus,
+        "cascade": cascade,
+        "all_stages": full,
+        "speedup": round(cascade["messages_per_second"] / full["messages_per_second"], 2)
+        if cascade["messages_per_second"] and full["messages_per_second"] else None,
+        "all_stages_threats_kept_by_cascade": kept / full_hits if full_hits else 1.0,
+    }, indent=2))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        replay_main(sys.argv[2:])
+        sys.exit(0)
+
+    app.run(host="0.0.0.0", port=5000, threaded=True)
@@ -3,54 +3,598 @@ Flask API for receiver verification and gift sending.
 Verifies receivers via facial recognition using ID and selfie photos.
 Approves receivers for receiving gifts if verification is successful.
 Supports random hand emoji conditions.
-Endpoints: /verify (POST), /send_gift (POST).
+Endpoints: /verify (POST), /verify/<job_id> (GET), /send_gift (POST).
+Face detection runs as a job on a process pool; /verify either waits for it (`mode=blocking`,
+the default) or returns a job id at once (`mode=async`) to poll on /verify/<job_id>.
+Uploads are decoded in memory and downscaled to `MAX_IMAGE_SIDE` before detection;
+face encodings are cached by content hash (`FACE_CACHE_SIZE`, optional `FACE_CACHE_DIR` spill).
+Approvals expire after `APPROVAL_TTL` seconds and live in an in-process store or, with
+`APPROVAL_STORE=sqlite`, in a shared SQLite WAL database so every worker sees them.
+Every approved face goes into a 1:N index (`FACE_INDEX_DIR`); new verifications report the
+closest receivers already enrolled with the same face.
+OpenCV and face_recognition are imported on first use, in the pool workers and the comparison step.
+Per-stage job timings feed the shared stage histograms on /metrics.
 """
-from flask import Flask, request, jsonify
-import cv2
-import face_recognition
+from flask import Flask, Request, request, jsonify
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
 import numpy as np
 import os
+import queue
 import random
-from werkzeug.utils import secure_filename
+import sqlite3
+import threading
+import time
+import uuid
+from instrumentation import REGISTRY, instrument_app
+
+class InMemoryRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+metrics = instrument_app(app, "fraud")
+face_cache_lookups = REGISTRY.counter("safegaming_face_cache_lookups_total",
+                                      "Face encoding cache lookups per verification image.", ("result",))
 
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_BYTES", str(16 * 1024 * 1024)))
+app.config["MAX_IMAGE_SIDE"] = int(os.environ.get("MAX_IMAGE_SIDE", "1024"))
+app.config["FACE_CACHE_SIZE"] = int(os.environ.get("FACE_CACHE_SIZE", "4096"))
+app.config["FACE_CACHE_DIR"] = os.environ.get("FACE_CACHE_DIR") or None
+app.config["VERIFY_POOL_SIZE"] = int(os.environ.get("VERIFY_POOL_SIZE", str(os.cpu_count() or 2)))
+app.config["VERIFY_QUEUE_DEPTH"] = int(os.environ.get("VERIFY_QUEUE_DEPTH", "64"))
+app.config["VERIFY_BACKPRESSURE"] = os.environ.get("VERIFY_BACKPRESSURE", "reject")
+app.config["VERIFY_QUEUE_TIMEOUT"] = float(os.environ.get("VERIFY_QUEUE_TIMEOUT", "10"))
+app.config["VERIFY_BLOCKING_TIMEOUT"] = float(os.environ.get("VERIFY_BLOCKING_TIMEOUT", "30"))
+app.config["VERIFY_JOB_TTL"] = float(os.environ.get("VERIFY_JOB_TTL", "600"))
+app.config["VERIFY_COMPLETION_THREADS"] = int(os.environ.get("VERIFY_COMPLETION_THREADS", "4"))
+app.config["APPROVAL_STORE"] = os.environ.get("APPROVAL_STORE", "memory")
+app.config["APPROVAL_DB_PATH"] = os.environ.get("APPROVAL_DB_PATH", "approvals.db")
+app.config["APPROVAL_TTL"] = float(os.environ.get("APPROVAL_TTL", str(24 * 3600)))
+app.config["APPROVAL_BATCH_MS"] = float(os.environ.get("APPROVAL_BATCH_MS", "5"))
+app.config["APPROVAL_WRITE_TIMEOUT"] = float(os.environ.get("APPROVAL_WRITE_TIMEOUT", "10"))
+app.config["FACE_INDEX_DIR"] = os.environ.get("FACE_INDEX_DIR", "face_index")
+app.config["FACE_INDEX_SAVE_EVERY"] = int(os.environ.get("FACE_INDEX_SAVE_EVERY", "100"))
+app.config["FACE_DUPLICATE_TOLERANCE"] = float(os.environ.get("FACE_DUPLICATE_TOLERANCE", "0.5"))
+app.config["FACE_DUPLICATE_TOP_K"] = int(os.environ.get("FACE_DUPLICATE_TOP_K", "5"))
+app.config["FACE_DUPLICATE_REJECT"] = os.environ.get("FACE_DUPLICATE_REJECT", "0") == "1"
 
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png"}
+NO_FACE = np.zeros((0, 128))
+FACE_INDEX_FILE = "index.npz"
+
+class InMemoryApprovalStore:
+    """Approvals for a single process."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def approve(self, receiver_id, condition):
+        with self.lock:
+            self.entries[receiver_id] = {"condition": condition, "status": "approved",
+                                         "expires_at": time.time() + self.ttl}
+
+    def get(self, receiver_id):
+        approval = self.entries.get(receiver_id)
+        if approval is None or approval["expires_at"] <= time.time():
+            return None
+        return approval
+
+class SQLiteApprovalStore:
+    """
+    Approvals shared by every process through one SQLite database in WAL mode.
+    Writes are grouped by a writer thread into one transaction per `batch_ms`; `approve`
+    returns once its batch is committed, or raises TimeoutError after `write_timeout` seconds. Reads are served from a local cache that is
+    dropped whenever `PRAGMA data_version` shows another connection committed.
+    """
+
+    def __init__(self, path, ttl, batch_ms=5.0, write_timeout=10.0):
+        self.path = path
+        self.ttl = ttl
+        self.batch_seconds = batch_ms / 1000.0
+        self.write_timeout = write_timeout
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.reader = self._connect()
+            self.reader.execute(
+                "CREATE TABLE IF NOT EXISTS approvals ("
+                "receiver_id TEXT PRIMARY KEY, condition TEXT NOT NULL, "
+                "status TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self.reader.execute("CREATE INDEX IF NOT EXISTS approvals_expires_at ON approvals (expires_at)")
+            self.cache = {}
+            self.data_version = self.reader.execute("PRAGMA data_version").fetchone()[0]
+            self.pending = queue.Queue()
+            self.writer = threading.Thread(target=self._write_batches, args=(self._connect(),), daemon=True)
+            self.writer.start()
+            self.pid = os.getpid()
+
+    def _write_batches(self, conn):
+        last_purge = 0.0
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT OR REPLACE INTO approvals VALUES (?, ?, ?, ?)", [row for row, _ in batch])
+                if time.time() - last_purge > 60:
+                    conn.execute("DELETE FROM approvals WHERE expires_at <= ?", (time.time(),))
+                    last_purge = time.time()
+                conn.execute("COMMIT")
+                error = None
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                error = e
+            for _, waiter in batch:
+                waiter["error"] = error
+                waiter["done"].set()
+
+    def approve(self, receiver_id, condition):
+        self._ensure_started()
+        waiter = {"done": threading.Event(), "error": None}
+        self.pending.put(((receiver_id, condition, "approved", time.time() + self.ttl), waiter))
+        if not waiter["done"].wait(self.write_timeout):
+            raise TimeoutError(f"Approval write not committed within {self.write_timeout:g}s")
+        if waiter["error"] is not None:
+            raise waiter["error"]
+
+    def get(self, receiver_id):
+        self._ensure_started()
+        with self.lock:
+            data_version = self.reader.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                self.cache.clear()
+                self.data_version = data_version
+            if receiver_id in self.cache:
+                approval = self.cache[receiver_id]
+            else:
+                row = self.reader.execute(
+                    "SELECT condition, status, expires_at FROM approvals WHERE receiver_id = ?",
+                    (receiver_id,)).fetchone()
+                approval = {"condition": row[0], "status": row[1], "expires_at": row[2]} if row else None
+                self.cache[receiver_id] = approval
+        if approval is None or approval["expires_at"] <= time.time():
+            return None
+        return approval
+
+def create_approval_store():
+    if app.config["APPROVAL_STORE"] == "sqlite":
+        return SQLiteApprovalStore(app.config["APPROVAL_DB_PATH"], app.config["APPROVAL_TTL"],
+                                   app.config["APPROVAL_BATCH_MS"], app.config["APPROVAL_WRITE_TIMEOUT"])
+    return InMemoryApprovalStore(app.config["APPROVAL_TTL"])
+
+approval_store = create_approval_store()
+
+class FaceEncodingCache:
+    """LRU of content hash -> face encoding, with an optional write-through spill directory."""
+
+    def __init__(self, max_size, spill_dir=None):
+        self.max_size = max_size
+        self.spill_dir = spill_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def get(self, key):
+        with self.lock:
+            encoding = self.entries.get(key)
+            if encoding is not None:
+                self.entries.move_to_end(key)
+                return encoding
+        if self.spill_dir:
+            try:
+                encoding = np.load(self._spill_path(key))
+            except (OSError, ValueError):
+                return None
+            self._remember(key, encoding)
+            return encoding
+        return None
 
-approved_receivers = {}
+    def _remember(self, key, encoding):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = encoding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def put(self, key, encoding):
+        self._remember(key, encoding)
+        if self.spill_dir:
+            tmp_path = f"{self._spill_path(key)}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    np.save(f, encoding)
+                os.replace(tmp_path, self._spill_path(key))
+            except OSError:
+                pass
+
+class FaceIndex:
+    """
+    Array-backed 1:N index of one face encoding per receiver_id.
+    Search is a blocked squared-distance scan: |x|^2 - 2 x.q + |q|^2 over `block_size` rows at a time.
+    """
+
+    def __init__(self, dim=128, block_size=65536):
+        self.dim = dim
+        self.block_size = block_size
+        self.encodings = np.zeros((1024, dim), dtype=np.float32)
+        self.norms = np.zeros(1024, dtype=np.float32)
+        self.receiver_ids = []
+        self.rows = {}
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self.unsaved = 0
+
+    def __len__(self):
+        return len(self.receiver_ids)
+
+    def add(self, receiver_id, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self.lock:
+            row = self.rows.get(receiver_id)
+            if row is None:
+                row = len(self.receiver_ids)
+                if row == len(self.encodings):
+                    self.encodings = np.concatenate([self.encodings, np.zeros_like(self.encodings)])
+                    self.norms = np.concatenate([self.norms, np.zeros_like(self.norms)])
+                self.receiver_ids.append(receiver_id)
+                self.rows[receiver_id] = row
+            self.encodings[row] = encoding
+            self.norms[row] = encoding @ encoding
+            self.unsaved += 1
+
+    def search(self, encoding, tolerance, k=5, exclude=None):
+        query = np.asarray(encoding, dtype=np.float32)
+        query_norm = query @ query
+        with self.lock:
+            count = len(self.receiver_ids)
+            encodings, norms, receiver_ids = self.encodings, self.norms, self.receiver_ids
+        limit = tolerance * tolerance
+        candidates = []
+        for start in range(0, count, self.block_size):
+            stop = min(start + self.block_size, count)
+            distances = norms[start:stop] - 2.0 * (encodings[start:stop] @ query) + query_norm
+            hits = np.flatnonzero(distances <= limit)
+            if len(hits) > k + 1:
+                hits = hits[np.argpartition(distances[hits], k)[:k + 1]]
+            candidates.extend((float(distances[i]), start + i) for i in hits)
+        candidates.sort()
+        matches = []
+        for squared, row in candidates:
+            if receiver_ids[row] == exclude:
+                continue
+            matches.append({"receiver_id": receiver_ids[row], "distance": round(float(np.sqrt(max(squared, 0.0))), 4)})
+            if len(matches) == k:
+                break
+        return matches
+
+    def save(self, index_dir):
+        """Writes encodings and receiver ids to one `index.npz`, replaced atomically."""
+        with self.save_lock:
+            with self.lock:
+                count = len(self.receiver_ids)
+                encodings = self.encodings[:count].copy()
+                receiver_ids = np.array(self.receiver_ids, dtype=str)
+                pending, self.unsaved = self.unsaved, 0
+            path = os.path.join(index_dir, FACE_INDEX_FILE)
+            tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.makedirs(index_dir, exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, encodings=encodings, receiver_ids=receiver_ids)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with self.lock:
+                    self.unsaved += pending
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    @classmethod
+    def load(cls, index_dir, dim=128):
+        """Empty index when nothing was saved yet; raises ValueError for an unreadable or inconsistent file."""
+        index = cls(dim)
+        path = os.path.join(index_dir, FACE_INDEX_FILE)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                encodings = data["encodings"]
+                receiver_ids = [str(receiver_id) for receiver_id in data["receiver_ids"]]
+        except (OSError, KeyError, ValueError) as e:
+            raise ValueError(f"Face index {path} is unreadable: {e}") from e
+        if encodings.ndim != 2 or len(encodings) != len(receiver_ids) or (len(encodings) and encodings.shape[1] != dim):
+            raise ValueError(f"Face index {path} is inconsistent: {encodings.shape} encodings "
+                             f"for {len(receiver_ids)} receivers")
+        capacity = max(1024, 1 << max(0, len(receiver_ids) - 1).bit_length())
+        index.encodings = np.zeros((capacity, dim), dtype=np.float32)
+        index.encodings[:len(encodings)] = encodings
+        index.norms = np.zeros(capacity, dtype=np.float32)
+        index.norms[:len(encodings)] = np.einsum("ij,ij->i", index.encodings[:len(encodings)],
+                                                 index.encodings[:len(encodings)])
+        index.receiver_ids = receiver_ids
+        index.rows = {receiver_id: row for row, receiver_id in enumerate(receiver_ids)}
+        return index
+
+face_index = FaceIndex.load(app.config["FACE_INDEX_DIR"])
+
+def enroll_face(receiver_id, encoding):
+    face_index.add(receiver_id, encoding)
+    if face_index.unsaved >= app.config["FACE_INDEX_SAVE_EVERY"]:
+        face_index.save(app.config["FACE_INDEX_DIR"])
+
+@atexit.register
+def _save_face_index():
+    if face_index.unsaved:
+        face_index.save(app.config["FACE_INDEX_DIR"])
+
+face_encoding_cache = FaceEncodingCache(app.config["FACE_CACHE_SIZE"], app.config["FACE_CACHE_DIR"])
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def verify_id(id_photo_path):
-    if os.path.exists(id_photo_path):
-        return True
-    return False
+def decode_image(image_bytes, max_side):
+    import cv2
 
-def verify_selfie(id_photo_path, selfie_path):
-    if not selfie_path:
-        return False
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width) if max_side else 1.0
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    id_image = face_recognition.load_image_file(id_photo_path)
-    selfie_image = face_recognition.load_image_file(selfie_path)
+def face_cache_key(image_bytes, max_side):
+    return f"{hashlib.sha256(image_bytes).hexdigest()}-{max_side}"
 
-    try:
-        id_face_encoding = face_recognition.face_encodings(id_image)[0]
-        selfie_face_encoding = face_recognition.face_encodings(selfie_image)[0]
-    except IndexError:
-        return False
+def detect_face_encoding(image_bytes, max_side, timings=None):
+    import face_recognition
 
-    results = face_recognition.compare_faces([id_face_encoding], selfie_face_encoding)
-    return results[0]
+    started = time.perf_counter()
+    image = decode_image(image_bytes, max_side)
+    decoded = time.perf_counter()
+    encodings = face_recognition.face_encodings(image) if image is not None else []
+    if timings is not None:
+        timings["decode_seconds"] = timings.get("decode_seconds", 0.0) + decoded - started
+        timings["detect_seconds"] = timings.get("detect_seconds", 0.0) + time.perf_counter() - decoded
+    return encodings[0] if encodings else NO_FACE
+
+def verify_id(id_photo_bytes):
+    return bool(id_photo_bytes)
 
 def get_random_hand_emoji():
     hand_emojis = ["✌🏻", "👌🏻", "🤘🏻", "🤙🏻", "🖖🏻", "🤞🏻", "👊🏻", "👍🏻", "👎🏻", "✊🏻"]
     return random.choice(hand_emojis)
 
+verification_jobs = {}
+verification_jobs_lock = threading.Lock()
+verification_slots = threading.BoundedSemaphore(app.config["VERIFY_QUEUE_DEPTH"])
+_verify_pool = None
+_completion_pool = None
+
+def get_verify_pool():
+    global _verify_pool
+    with verification_jobs_lock:
+        if _verify_pool is None:
+            # Forking this threaded server could copy locks held by other threads into the workers.
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _verify_pool = ProcessPoolExecutor(max_workers=app.config["VERIFY_POOL_SIZE"],
+                                               mp_context=multiprocessing.get_context(start_method))
+        return _verify_pool
+
+def get_completion_pool():
+    """Threads that finish verifications, so slow approval or index writes never block the pool's result thread."""
+    global _completion_pool
+    with verification_jobs_lock:
+        if _completion_pool is None:
+            _completion_pool = ThreadPoolExecutor(max_workers=app.config["VERIFY_COMPLETION_THREADS"],
+                                                  thread_name_prefix="verify-completion")
+        return _completion_pool
+
+def _encode_images_job(images, max_side, submitted_at):
+    timings = {"queue_wait_seconds": time.time() - submitted_at}
+    encodings = [detect_face_encoding(image_bytes, max_side, timings) for image_bytes in images]
+    return encodings, timings
+
+def _purge_finished_jobs():
+    cutoff = time.time() - app.config["VERIFY_JOB_TTL"]
+    with verification_jobs_lock:
+        for job_id in [job_id for job_id, job in verification_jobs.items()
+                       if job["done"].is_set() and job["finished_at"] < cutoff]:
+            del verification_jobs[job_id]
+
+def _finish_job(job, http_status, result):
+    try:
+        job["timings"]["total_seconds"] = time.time() - job["created_at"]
+        for name, seconds in job["timings"].items():
+            if name.endswith("_seconds"):
+                metrics.observe_stage(name[:-len("_seconds")], seconds)
+        job["http_status"] = http_status
+        job["result"] = result
+        job["status"] = "done" if http_status == 200 else "failed"
+        job["finished_at"] = time.time()
+    finally:
+        verification_slots.release()
+        job["done"].set()
+
+def _complete_verification(job, encodings):
+    try:
+        _run_verification(job, encodings)
+    except Exception as e:
+        if not job["done"].is_set():
+            _finish_job(job, 500, {"error": f"Verification failed: {e}"})
+        else:
+            raise
+
+def _run_verification(job, encodings):
+    import face_recognition
+
+    started = time.perf_counter()
+    id_face_encoding, selfie_face_encoding = encodings
+    matched = (id_face_encoding.size and selfie_face_encoding.size
+               and face_recognition.compare_faces([id_face_encoding], selfie_face_encoding)[0])
+    job["timings"]["compare_seconds"] = time.perf_counter() - started
+    if not matched:
+        _finish_job(job, 400, {"error": "Selfie verification failed"})
+        return
+
+    receiver_id = job["receiver_id"]
+    started = time.perf_counter()
+    duplicates = face_index.search(id_face_encoding, app.config["FACE_DUPLICATE_TOLERANCE"],
+                                   app.config["FACE_DUPLICATE_TOP_K"], exclude=receiver_id)
+    job["timings"]["duplicate_search_seconds"] = time.perf_counter() - started
+    if duplicates and app.config["FACE_DUPLICATE_REJECT"]:
+        _finish_job(job, 409, {"error": "Face is already verified under another receiver",
+                               "possible_duplicates": duplicates})
+        return
+
+    started = time.perf_counter()
+    try:
+        approval_store.approve(receiver_id, job["condition"])
+    except Exception as e:
+        _finish_job(job, 500, {"error": f"Could not store approval: {e}"})
+        return
+    job["timings"]["approval_write_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    try:
+        enroll_face(receiver_id, id_face_encoding)
+    except Exception:
+        # The approval is already committed; a failed enrolment only weakens later duplicate checks.
+        logger.exception("Could not enrol %s in the face index", receiver_id)
+    job["timings"]["index_write_seconds"] = time.perf_counter() - started
+    _finish_job(job, 200, {
+        "message": "Receiver verification successful",
+        "receiver_id": receiver_id,
+        "condition": job["condition"],
+        "status": "approved",
+        "possible_duplicates": duplicates
+    })
+
+def acquire_verification_slot():
+    if app.config["VERIFY_BACKPRESSURE"] == "queue":
+        return verification_slots.acquire(timeout=app.config["VERIFY_QUEUE_TIMEOUT"])
+    return verification_slots.acquire(blocking=False)
+
+def submit_verification(id_photo_bytes, selfie_bytes, receiver_id, condition):
+    """Caller must hold a slot from acquire_verification_slot(); it is released when the job finishes."""
+    _purge_finished_jobs()
+    max_side = app.config["MAX_IMAGE_SIDE"]
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "receiver_id": receiver_id,
+        "condition": condition,
+        "created_at": time.time(),
+        "finished_at": None,
+        "timings": {},
+        "http_status": None,
+        "result": None,
+        "future": None,
+        "done": threading.Event(),
+    }
+    with verification_jobs_lock:
+        verification_jobs[job["job_id"]] = job
+
+    images = [id_photo_bytes, selfie_bytes]
+    keys = [face_cache_key(image_bytes, max_side) for image_bytes in images]
+    encodings = [face_encoding_cache.get(key) for key in keys]
+    missing = [i for i, encoding in enumerate(encodings) if encoding is None]
+    job["timings"]["cache_hits"] = len(images) - len(missing)
+    face_cache_lookups.inc(("hit",), len(images) - len(missing))
+    face_cache_lookups.inc(("miss",), len(missing))
+    if not missing:
+        _complete_verification(job, encodings)
+        return job
+
+    def complete(detected, timings):
+        try:
+            job["timings"].update(timings)
+            for i, encoding in zip(missing, detected):
+                face_encoding_cache.put(keys[i], encoding)
+                encodings[i] = encoding
+        except Exception as e:
+            _finish_job(job, 500, {"error": f"Verification job failed: {e}"})
+            return
+        _complete_verification(job, encodings)
+
+    # Runs on the pool's result thread: only collect the result and hand the rest to the completion pool.
+    def on_done(future):
+        try:
+            detected, timings = future.result()
+        except Exception as e:
+            _finish_job(job, 500, {"error": f"Verification job failed: {e}"})
+            return
+        try:
+            get_completion_pool().submit(complete, detected, timings)
+        except RuntimeError as e:
+            _finish_job(job, 503, {"error": f"Verification pool unavailable: {e}"})
+
+    try:
+        job["future"] = get_verify_pool().submit(_encode_images_job, [images[i] for i in missing], max_side, time.time())
+    except Exception as e:
+        _finish_job(job, 503, {"error": f"Verification pool unavailable: {e}"})
+        return job
+    job["future"].add_done_callback(on_done)
+    return job
+
+def job_view(job):
+    status = job["status"]
+    if status == "queued" and job["future"] is not None and job["future"].running():
+        status = "running"
+    view = {"job_id": job["job_id"], "status": status, "timings": job["timings"]}
+    if job["result"] is not None:
+        view.update(job["result"])
+        view["status"] = job["result"].get("status", status)
+        view["job_status"] = status
+    return view
+
+@app.route("/verify/<job_id>", methods=["GET"])
+def verification_status(job_id):
+    with verification_jobs_lock:
+        job = verification_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown verification job"}), 404
+    return jsonify(job_view(job)), 200
+
 @app.route("/verify", methods=["POST"])
 def verify_receiver():
     if "id_photo" not in request.files or "selfie" not in request.files:
@@ -62,34 +606,36 @@ def verify_receiver():
     if not allowed_file(id_photo.filename) or not allowed_file(selfie.filename):
         return jsonify({"error": "Invalid file type. Only JPG, JPEG, and PNG are allowed"}), 400
 
-    id_photo_path = os.path.join(app.config["UPLOAD_FOLDER"], secure_filename(id_photo.filename))
-    selfie_path = os.path.join(app.config["UPLOAD_FOLDER"], secure_filename(selfie.filename))
-    id_photo.save(id_photo_path)
-    selfie.save(selfie_path)
+    id_photo_bytes = id_photo.read()
+    selfie_bytes = selfie.read()
 
-    if not verify_id(id_photo_path):
+    if not verify_id(id_photo_bytes):
         return jsonify({"error": "ID verification failed"}), 400
 
-    condition = get_random_hand_emoji()
-
-    if not verify_selfie(id_photo_path, selfie_path):
+    if not selfie_bytes:
         return jsonify({"error": "Selfie verification failed"}), 400
 
     receiver_id = request.form.get("receiver_id")
     if not receiver_id:
         return jsonify({"error": "Receiver ID is required"}), 400
 
-    approved_receivers[receiver_id] = {
-        "condition": condition,
-        "status": "approved"
-    }
+    mode = request.form.get("mode", "blocking")
+    if mode not in ("blocking", "async"):
+        return jsonify({"error": "Mode must be 'blocking' or 'async'"}), 400
+    try:
+        timeout = float(request.form.get("timeout", app.config["VERIFY_BLOCKING_TIMEOUT"]))
+    except ValueError:
+        return jsonify({"error": "Timeout must be a number"}), 400
 
-    return jsonify({
-        "message": "Receiver verification successful",
-        "receiver_id": receiver_id,
-        "condition": condition,
-        "status": "approved"
-    }), 200
+    if not acquire_verification_slot():
+        return jsonify({"error": "Too many verifications in progress, retry later"}), 429
+
+    condition = get_random_hand_emoji()
+    job = submit_verification(id_photo_bytes, selfie_bytes, receiver_id, condition)
+
+    if mode == "blocking" and job["done"].wait(timeout):
+        return jsonify(job_view(job)), job["http_status"]
+    return jsonify(job_view(job)), 202
 
 @app.route("/send_gift", methods=["POST"])
 def send_gift():
@@ -101,10 +647,11 @@ def send_gift():
     if not sender_id or not receiver_id or not condition:
         return jsonify({"error": "Sender ID, receiver ID, and condition are required"}), 400
 
-    if receiver_id not in approved_receivers:
+    approval = approval_store.get(receiver_id)
+    if approval is None:
         return jsonify({"error": "Receiver is not verified"}), 403
 
-    if approved_receivers[receiver_id]["condition"] != condition:
+    if approval["condition"] != condition:
         return jsonify({"error": "Invalid condition for receiver"}), 403
 
     print(f"Receiver {receiver_id} has received a gift from sender {sender_id} with condition: {condition}")
@@ -1,19 +1,43 @@
 """
 Flask API to monitor game file integrity and checks if critical files exist.
-Endpoint: `/status` (GET) 
+Endpoint: `/status` (GET)
 Customize `GAME_FILES_DIR` and `critical_files` for your game.
+Every file under `GAME_FILES_DIR` is hashed (chunked reads on a thread pool) into a Merkle tree
+and compared with a trusted baseline; only files whose size, mtime or inode changed since the
+cached manifest are re-hashed. The scan runs in a background thread every `INTEGRITY_SCAN_SECONDS`
+and /status serves its latest result. The baseline is recorded on the very first scan only;
+run `python game_transparency.py baseline` to re-record it.
 """
 
+import hashlib
+import json
+import logging
 import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, jsonify
+from instrumentation import instrument_app
 
 app = Flask(__name__)
+metrics = instrument_app(app, "integrity")
 
-GAME_FILES_DIR = ///put the director path of the game
+GAME_FILES_DIR = os.environ.get("GAME_FILES_DIR", ".")  # put the directory path of the game
+INTEGRITY_STATE_DIR = os.environ.get("INTEGRITY_STATE_DIR", ".integrity")
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+INTEGRITY_SCAN_SECONDS = float(os.environ.get("INTEGRITY_SCAN_SECONDS", "60"))
+HASH_CHUNK_BYTES = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+_scan_lock = threading.Lock()
+_manifest_cache = {}
 
 def check_file_integrity():
     results = {}
-    critical_files = ["game.exe", "config.ini"] 
+    critical_files = ["game.exe", "config.ini"]
     for file_name in critical_files:
         file_path = os.path.join(GAME_FILES_DIR, file_name)
         if not os.path.exists(file_path):
@@ -22,12 +46,231 @@ def check_file_integrity():
             results[file_name] = "File exists"
     return results
 
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_BYTES)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+def walk_files(root, state_dir, errors=None):
+    """Yields every regular file under `root`; unreadable entries are skipped and appended to `errors`."""
+    skip = os.path.abspath(state_dir)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.abspath(entry.path) != skip:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            relative = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                            yield relative, entry.path, st.st_size, st.st_mtime_ns, st.st_ino
+                    except OSError as e:
+                        if errors is not None:
+                            errors.append(_scan_error(root, entry.path, e))
+        except OSError as e:
+            if errors is not None:
+                errors.append(_scan_error(root, directory, e))
+
+def _scan_error(root, path, error):
+    return {"path": os.path.relpath(path, root).replace(os.sep, "/"), "error": error.strerror or str(error)}
+
+def build_manifest(root, previous=None, state_dir=INTEGRITY_STATE_DIR, workers=HASH_WORKERS, errors=None):
+    previous = previous or {}
+    files = {}
+    to_hash = []
+    for relative, path, size, mtime_ns, inode in walk_files(root, state_dir, errors):
+        entry = {"size": size, "mtime_ns": mtime_ns, "inode": inode}
+        cached = previous.get(relative)
+        if cached and all(cached.get(key) == value for key, value in entry.items()):
+            entry["sha256"] = cached["sha256"]
+        else:
+            to_hash.append((relative, path))
+        files[relative] = entry
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for (relative, _), digest in zip(to_hash, pool.map(lambda item: _hash_or_none(item[1]), to_hash)):
+            if digest is None:
+                files.pop(relative, None)
+            else:
+                files[relative]["sha256"] = digest
+    return files, len(to_hash)
+
+def _hash_or_none(path):
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+def merkle_tree(files):
+    """Returns {directory: hash} for every directory ("" is the root) from {relative path: entry}."""
+    children = {"": {}}
+    for relative, entry in files.items():
+        parts = relative.split("/")
+        for depth in range(1, len(parts)):
+            parent, name = "/".join(parts[:depth - 1]), parts[depth - 1]
+            children.setdefault(parent, {})[name] = ("d", "/".join(parts[:depth]))
+            children.setdefault("/".join(parts[:depth]), {})
+        children.setdefault("/".join(parts[:-1]), {})[parts[-1]] = ("f", entry["sha256"])
+    hashes = {}
+    for directory in sorted(children, key=lambda d: d.count("/") + (d != ""), reverse=True):
+        digest = hashlib.sha256()
+        for name in sorted(children[directory]):
+            kind, value = children[directory][name]
+            child_hash = hashes[value] if kind == "d" else value
+            digest.update(f"{kind}\0{name}\0{child_hash}\n".encode("utf-8"))
+        hashes[directory] = digest.hexdigest()
+    return hashes
+
+def diff_manifests(baseline, current):
+    base_tree, current_tree = baseline["tree"], current["tree"]
+    if base_tree.get("") == current_tree.get(""):
+        return {"changed_subtrees": [], "modified": [], "added": [], "removed": []}
+    changed_subtrees = sorted(
+        directory for directory in set(base_tree) | set(current_tree)
+        if directory and base_tree.get(directory) != current_tree.get(directory)
+    )
+    base_files, current_files = baseline["files"], current["files"]
+    dirty = set(changed_subtrees) | {""}
+    modified, added, removed = [], [], []
+    for relative in set(base_files) | set(current_files):
+        if _parent(relative) not in dirty:
+            continue
+        if relative not in current_files:
+            removed.append(relative)
+        elif relative not in base_files:
+            added.append(relative)
+        elif base_files[relative]["sha256"] != current_files[relative]["sha256"]:
+            modified.append(relative)
+    return {"changed_subtrees": changed_subtrees, "modified": sorted(modified),
+            "added": sorted(added), "removed": sorted(removed)}
+
+def _parent(relative):
+    if relative == "":
+        return None
+    return relative.rsplit("/", 1)[0] if "/" in relative else ""
+
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def scan_game_files(root=GAME_FILES_DIR, state_dir=INTEGRITY_STATE_DIR):
+    """Returns (manifest, rehashed files, scan errors); the cached manifest is rewritten only when it changed."""
+    with _scan_lock:
+        cache_path = os.path.join(state_dir, "manifest.json")
+        cached = _manifest_cache.get(cache_path) or _load_json(cache_path)
+        previous = cached["files"] if cached and cached.get("root") == os.path.abspath(root) else None
+        errors = []
+        files, rehashed = build_manifest(root, previous, state_dir, errors=errors)
+        manifest = {"root": os.path.abspath(root), "files": files, "tree": merkle_tree(files)}
+        if files != previous:
+            _save_json(cache_path, manifest)
+        _manifest_cache[cache_path] = manifest
+        return manifest, rehashed, errors
+
+def record_baseline(root=GAME_FILES_DIR, state_dir=INTEGRITY_STATE_DIR):
+    manifest, _, _ = scan_game_files(root, state_dir)
+    _save_json(os.path.join(state_dir, "baseline.json"), manifest)
+    return manifest
+
+def check_manifest_integrity(root=GAME_FILES_DIR, state_dir=INTEGRITY_STATE_DIR):
+    baseline_path = os.path.join(state_dir, "baseline.json")
+    # Only a state directory that has never seen a scan gets an automatic baseline; a baseline that
+    # disappears later is reported, since silently re-recording it would hide tampering.
+    first_run = not os.path.exists(baseline_path) and not os.path.exists(os.path.join(state_dir, "manifest.json"))
+    with metrics.stage("manifest_scan"):
+        manifest, rehashed, errors = scan_game_files(root, state_dir)
+    if first_run:
+        _save_json(baseline_path, manifest)
+    baseline = _load_json(baseline_path)
+    result = {
+        "root_hash": manifest["tree"][""],
+        "files": len(manifest["files"]),
+        "rehashed_files": rehashed,
+        "scan_errors": errors,
+    }
+    if baseline is None or baseline.get("root") != manifest["root"]:
+        result.update({
+            "baseline_root_hash": None,
+            "intact": False,
+            "error": "No baseline for this directory; run `python game_transparency.py baseline` to record one",
+        })
+        return result
+    result.update({
+        "baseline_root_hash": baseline["tree"][""],
+        "intact": manifest["tree"][""] == baseline["tree"][""] and not errors,
+        **diff_manifests(baseline, manifest),
+    })
+    return result
+
+integrity_status = None
+integrity_checked = threading.Event()
+_monitor_thread = None
+_monitor_lock = threading.Lock()
+
+def refresh_integrity():
+    global integrity_status
+    try:
+        status = check_manifest_integrity()
+    except Exception as e:
+        logger.exception("Integrity scan failed")
+        status = {"intact": False, "error": f"Integrity scan failed: {e}"}
+    status["checked_at"] = time.time()
+    integrity_status = status
+    integrity_checked.set()
+
+def monitor_integrity():
+    while True:
+        refresh_integrity()
+        time.sleep(INTEGRITY_SCAN_SECONDS)
+
+def start_monitor():
+    global _monitor_thread
+    with _monitor_lock:
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=monitor_integrity)
+            _monitor_thread.daemon = True
+            _monitor_thread.start()
+
 @app.route('/status', methods=['GET'])
 def get_status():
+    start_monitor()
     file_integrity = check_file_integrity()
+    integrity_checked.wait()
     return jsonify({
-        "file_integrity_checks": file_integrity
+        "file_integrity_checks": file_integrity,
+        "manifest_integrity": integrity_status
     })
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "baseline":
+        manifest = record_baseline()
+        print(f"Recorded baseline of {len(manifest['files'])} files, root hash {manifest['tree']['']}")
+        sys.exit(0)
+
+    start_monitor()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,175 @@
+"""
+Single Flask gateway that serves every SafeGamingApi service from one process.
+Each service module keeps its own Flask app and is mounted under a URL prefix (see `SERVICES`);
+the module, and with it any heavy dependency, is imported on the first request to that prefix.
+Endpoints: /services (GET) reports load state, import time and memory per service,
+/services/warm (POST, optional `services` list) imports and warms services ahead of traffic,
+/metrics (GET) exports the request and stage metrics of every loaded service.
+Run `python gateway.py [--warm all|name,...]` to serve on port 5000, or
+`python gateway.py report` to import every service once and print the timing report as JSON.
+"""
+from flask import Flask, jsonify, request
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from instrumentation import instrument_app
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+GATEWAY_PORT = int(os.environ.get("GATEWAY_PORT", "5000"))
+GATEWAY_WARM = os.environ.get("GATEWAY_WARM", "")
+
+# name: (URL prefix, module, optional warm-up function in that module)
+SERVICES = {
+    "integrity": ("/integrity", "game_transparency", "start_monitor"),
+    "threats": ("/threats", "Voice_Threat_Detection", "get_threat_service"),
+    "timer": ("/timer", "TimelyReminder", "start_scheduler"),
+    "resources": ("/resources", "RealtimeDataTaken", "start_monitor"),
+    "swear": ("/swear", "HarshwordsEncryption", "start_watching"),
+    "gambling": ("/gambling", "Gambling_game_Detection", None),
+    "crypto": ("/crypto", "DataEncryption", None),
+    "fraud": ("/fraud", "fraud_detection", "get_verify_pool"),
+    "moderation": ("/moderation", "chat_moderation", "warm_up"),
+}
+
+def _rss_mb():
+    return psutil.Process().memory_info().rss / (1024 * 1024) if psutil else None
+
+class LazyService:
+    """WSGI app that imports its service module on first call and then delegates to the module's app."""
+
+    def __init__(self, name, prefix, module_name, warm_up=None):
+        self.name = name
+        self.prefix = prefix
+        self.module_name = module_name
+        self.warm_up_name = warm_up
+        self.module = None
+        self.error = None
+        self.import_seconds = None
+        self.warm_up_seconds = None
+        self.rss_delta_mb = None
+        self.modules_imported = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.module is not None or self.error is not None:
+            return self.module
+        with self.lock:
+            if self.module is None and self.error is None:
+                modules_before, rss_before = len(sys.modules), _rss_mb()
+                started = time.perf_counter()
+                try:
+                    module = importlib.import_module(self.module_name)
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                else:
+                    self.import_seconds = time.perf_counter() - started
+                    self.modules_imported = len(sys.modules) - modules_before
+                    if rss_before is not None:
+                        self.rss_delta_mb = _rss_mb() - rss_before
+                    self.module = module
+        return self.module
+
+    def warm(self):
+        module = self.load()
+        if module is None or self.warm_up_name is None or self.warm_up_seconds is not None:
+            return
+        with self.lock:
+            if self.warm_up_seconds is None:
+                rss_before = _rss_mb()
+                started = time.perf_counter()
+                getattr(module, self.warm_up_name)()
+                self.warm_up_seconds = time.perf_counter() - started
+                if rss_before is not None:
+                    self.rss_delta_mb = (self.rss_delta_mb or 0.0) + _rss_mb() - rss_before
+
+    def report(self):
+        return {
+            "prefix": self.prefix,
+            "module": self.module_name,
+            "loaded": self.module is not None,
+            "error": self.error,
+            "import_seconds": None if self.import_seconds is None else round(self.import_seconds, 4),
+            "warm_up_seconds": None if self.warm_up_seconds is None else round(self.warm_up_seconds, 4),
+            "rss_delta_mb": None if self.rss_delta_mb is None else round(self.rss_delta_mb, 1),
+            "modules_imported": self.modules_imported,
+        }
+
+    def __call__(self, environ, start_response):
+        module = self.load()
+        if module is None:
+            body = json.dumps({"error": f"Service '{self.name}' failed to load", "detail": self.error}).encode()
+            start_response("503 SERVICE UNAVAILABLE", [("Content-Type", "application/json"),
+                                                      ("Content-Length", str(len(body)))])
+            return [body]
+        return module.app.wsgi_app(environ, start_response)
+
+app = Flask(__name__)
+instrument_app(app, "gateway")
+gateway_started = time.perf_counter()
+services = {name: LazyService(name, prefix, module, warm_up) for name, (prefix, module, warm_up) in SERVICES.items()}
+app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {service.prefix: service for service in services.values()})
+
+def warm_services(names=None):
+    for name in names or list(services):
+        service = services[name]
+        try:
+            service.warm()
+        except Exception as e:
+            service.error = f"{type(e).__name__}: {e}"
+
+def services_report():
+    return {
+        "uptime_seconds": round(time.perf_counter() - gateway_started, 3),
+        "rss_mb": None if psutil is None else round(_rss_mb(), 1),
+        "services": {name: service.report() for name, service in services.items()},
+    }
+
+def _parse_service_names(value):
+    if not value or value == "all":
+        return None
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in services]
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(unknown)}")
+    return names
+
+@app.route('/services', methods=['GET'])
+def get_services():
+    return jsonify(services_report())
+
+@app.route('/services/warm', methods=['POST'])
+def warm_services_api():
+    data = request.get_json(silent=True) or {}
+    names = data.get("services")
+    if names is not None and (not isinstance(names, list) or any(name not in services for name in names)):
+        return jsonify({"error": "'services' must be a list of service names",
+                        "available_services": list(services)}), 400
+    warm_services(names)
+    return jsonify(services_report())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve every SafeGamingApi service from one process.")
+    parser.add_argument("command", nargs="?", choices=["serve", "report"], default="serve")
+    parser.add_argument("--warm", default=GATEWAY_WARM,
+                        help="'all' or a comma-separated list of services to load before serving")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        warm_services(_parse_service_names(args.warm) if args.warm else None)
+        print(json.dumps(services_report(), indent=2))
+        return
+    if args.warm:
+        warm_services(_parse_service_names(args.warm))
+    app.run(host="0.0.0.0", port=GATEWAY_PORT, threaded=True)
+
+if __name__ == "__main__":
+    main()
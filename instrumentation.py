@@ -0,0 +1,313 @@
+"""
+Shared request and stage instrumentation for the SafeGamingApi services.
+`metrics = instrument_app(app, "swear")` records, per endpoint, a latency histogram, a request
+counter by status and an in-flight gauge, and adds these routes to the app:
+/metrics (GET, Prometheus text format),
+/debug/profile (POST {"slowest": N, "seconds": S} to arm, GET for the captured profiles, DELETE to disarm),
+only when `ENABLE_PROFILER=1`, since it exposes stack traces and has no authentication.
+`with metrics.stage("encode"):` or `metrics.observe_stage("detect", seconds)` time hot-path stages.
+The profiler samples the stacks of in-flight requests from a background thread only while armed
+and keeps the slowest N; when it is off each request pays one attribute check.
+"""
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from flask import Response, g, jsonify, request
+import bisect
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_SLOWEST = int(os.environ.get("PROFILE_SLOWEST", "0"))
+PROFILE_MAX_DEPTH = 64
+ENABLE_PROFILER = os.environ.get("ENABLE_PROFILER", "0") == "1"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in itertools.chain(zip(labelnames, labels), extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self._render_series(labels, value))
+        return lines
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, labels, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {repr(total)}")
+        lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+request_duration = REGISTRY.histogram(
+    "safegaming_request_duration_seconds", "Request latency by endpoint.", ("service", "endpoint", "method"))
+requests_total = REGISTRY.counter(
+    "safegaming_requests_total", "Requests by endpoint and status.", ("service", "endpoint", "method", "status"))
+requests_in_flight = REGISTRY.gauge(
+    "safegaming_requests_in_flight", "Requests currently being handled.", ("service", "endpoint"))
+stage_duration = REGISTRY.histogram(
+    "safegaming_stage_duration_seconds", "Latency of hot-path stages.", ("service", "stage"))
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for the slowest requests. While armed, a thread samples the stack of every
+    thread with a request in flight every `interval` seconds; each finished request's collapsed
+    stacks are kept if it is among the `slowest` longest so far.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.armed = False
+        self.slowest = 0
+        self.armed_until = None
+        self.active = {}
+        self.captured = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def arm(self, slowest, seconds=None):
+        with self.lock:
+            self.slowest = slowest
+            self.captured = []
+            self.armed_until = None if seconds is None else time.monotonic() + seconds
+            self.armed = slowest > 0
+            if self.armed and (self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def disarm(self):
+        with self.lock:
+            self.armed = False
+            self.active.clear()
+
+    def begin(self):
+        samples = StackCounter()
+        with self.lock:
+            self.active[threading.get_ident()] = samples
+        return samples
+
+    def end(self, samples, duration, info):
+        with self.lock:
+            self.active.pop(threading.get_ident(), None)
+            if not self.armed:
+                return
+            entry = (duration, next(self.counter), info, samples)
+            if len(self.captured) < self.slowest:
+                heapq.heappush(self.captured, entry)
+            elif duration > self.captured[0][0]:
+                heapq.heapreplace(self.captured, entry)
+
+    def _run(self):
+        while self.armed:
+            if self.armed_until is not None and time.monotonic() >= self.armed_until:
+                self.armed = False
+                break
+            frames = sys._current_frames()
+            with self.lock:
+                active = list(self.active.items())
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def report(self):
+        with self.lock:
+            captured = sorted(self.captured, reverse=True)
+            state = {"armed": self.armed, "slowest": self.slowest, "interval_ms": self.interval * 1000.0}
+        state["requests"] = [
+            dict(info, duration_seconds=round(duration, 6), samples=sum(samples.values()),
+                 stacks=dict(samples.most_common()))
+            for duration, _, info, samples in captured
+        ]
+        return state
+
+def _collapse(frame):
+    parts = []
+    while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+profiler = SlowRequestProfiler()
+if PROFILE_SLOWEST:
+    profiler.arm(PROFILE_SLOWEST)
+
+class ServiceMetrics:
+    def __init__(self, service):
+        self.service = service
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage_duration.observe((self.service, name), time.perf_counter() - started)
+
+    def observe_stage(self, name, seconds):
+        stage_duration.observe((self.service, name), seconds)
+
+def instrument_app(app, service):
+    """Adds request metrics, /metrics and (with ENABLE_PROFILER) /debug/profile to `app`; returns its ServiceMetrics."""
+    metrics = ServiceMetrics(service)
+    base_request_class = app.request_class
+
+    class InstrumentedRequest(base_request_class):
+        def get_json(self, *args, **kwargs):
+            with metrics.stage("json_parse"):
+                return super().get_json(*args, **kwargs)
+
+    app.request_class = InstrumentedRequest
+
+    @app.before_request
+    def _start_request_metrics():
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.metrics_endpoint = endpoint
+        g.metrics_started = time.perf_counter()
+        g.metrics_status = 500
+        g.metrics_samples = profiler.begin() if profiler.armed else None
+        requests_in_flight.inc((service, endpoint))
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        endpoint = g.metrics_endpoint
+        requests_in_flight.dec((service, endpoint))
+        request_duration.observe((service, endpoint, request.method), duration)
+        requests_total.inc((service, endpoint, request.method, str(g.metrics_status)))
+        if g.metrics_samples is not None:
+            profiler.end(g.metrics_samples, duration, {"service": service, "endpoint": endpoint,
+                                                       "method": request.method, "status": g.metrics_status})
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    if not ENABLE_PROFILER:
+        return metrics
+
+    @app.route("/debug/profile", methods=["GET", "POST", "DELETE"])
+    def profile_endpoint():
+        if request.method == "POST":
+            data = request.get_json(silent=True) or {}
+            slowest, seconds = data.get("slowest", 10), data.get("seconds")
+            if isinstance(slowest, bool) or not isinstance(slowest, int) or slowest <= 0:
+                return jsonify({"error": "'slowest' must be a positive integer"}), 400
+            if seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0):
+                return jsonify({"error": "'seconds' must be a positive number"}), 400
+            profiler.arm(slowest, seconds)
+        elif request.method == "DELETE":
+            profiler.disarm()
+        return jsonify(profiler.report())
+
+    return metrics